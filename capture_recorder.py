@@ -0,0 +1,45 @@
+### CoronAlert Scanner capture recorder
+### Record all the BLE advertisements received, to replay them later on a computer
+### (python3 tools/replay.py capture.bin)
+
+### Copy this file to a nRF52840 board as code.py
+
+### The CIRCUITPY drive must be writable by CircuitPython, with a boot.py containing:
+###     import storage
+###     storage.remount("/", readonly=False)
+### (the drive is then read only for the computer, rename or delete boot.py to edit the files again)
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+import time
+import gc
+
+import _bleio
+
+### https://github.com/adafruit/Adafruit_CircuitPython_BLE
+from adafruit_ble import BLERadio
+
+### Shared scanner code (copy lib/contact_scanner to the lib directory of the board)
+from contact_scanner.engine import Scanner
+from contact_scanner.capture import RecordingAdapter
+
+### Stop recording before the flash is full
+max_records = 20000
+scan_time_s = 10
+
+ble = BLERadio()
+ble.name = "Recorder"
+
+with open("/capture.bin", "wb") as capture_file:
+    recorder = RecordingAdapter(_bleio.adapter, capture_file)
+    ### No output, the Scanner is only there to show the number of devices tracked
+    scanner = Scanner(16, [], adapter=recorder, scan_time_s=scan_time_s)
+    while recorder.records < max_records:
+        scanner.scan()
+        gc.collect()
+        print("Records:", recorder.records, "Tracked:", scanner.devices.count, "Memfree:", gc.mem_free())
+
+print("Capture complete")
+while True:
+    time.sleep(1)
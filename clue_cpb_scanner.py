@@ -28,11 +28,10 @@
 ### OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 ### SOFTWARE.
 
-### TODO
-### look at logging to a file if it can be done in some moderately safe way
-### what about a pre-existing fixed size file?
+### Logging to a pre-existing fixed size file: set log_path below
+### (see contact_scanner.flashlog, read it on a computer with tools/dump_log.py)
 
-### TODO - keep an eye on memory - avoid the cp and clue objects - perhaps only store what is needed from Advertisement
+### TODO - keep an eye on memory - avoid the cp and clue objects
 
 ### Tested: Adafruit CircuitPython 5.3.1 on 2020-07-13; Adafruit CLUE nRF52840 Express with nRF52840
 ### Tested: Adafruit CircuitPython 6.0.0-beta.0 on 2020-09-21; Adafruit CLUE nRF52840 Express with nRF52840
@@ -55,7 +54,15 @@ from adafruit_display_text.label import Label
 
 ### https://github.com/adafruit/Adafruit_CircuitPython_BLE
 from adafruit_ble import BLERadio
-from adafruit_ble.advertising.standard import Advertisement
+
+### Shared scanner code (copy lib/contact_scanner to the lib directory of the board)
+from contact_scanner.engine import Scanner
+from contact_scanner.outputs import LabelOutput
+from contact_scanner.advertising import complete_name
+from contact_scanner.stats import LoopStats
+from contact_scanner.distinct import DistinctCounter
+from contact_scanner.flashlog import FlashLog
+from contact_scanner.telemetry import Telemetry
 
 ### These imports works on CLUE, CPB (and CPX on 5.x)
 from audiocore import RawSample
@@ -130,12 +137,13 @@ for idx in range(rows):
     row_y += row_spacing
     rows_group.append(row_label)
 
+### Three lines: the addresses seen recently, the totals, then the loop statistics
 summary_label = Label(font=terminalio.FONT,
                       text="",
-                      max_glyphs=40,   ### maximum that will fit 240/6
+                      max_glyphs=122,   ### 3 lines of maximum that will fit 240/6
                       color=0x00c0c0)
                       
-summary_label.y = 220       
+summary_label.y = 192       
 
 screen_group = Group(max_size=2)
 screen_group.append(rows_group)
@@ -145,10 +153,6 @@ display.show(screen_group)  ### was screen_group
 
 debug = 3
 
-DATA_MASK_LEVELS = 3
-
-data_mask = 0
-
 def d_print(level, *args, **kwargs):
     """A simple conditional print for debugging based on global debug level."""
     if not isinstance(level, int):
@@ -157,157 +161,122 @@ def d_print(level, *args, **kwargs):
         print(*args, **kwargs)
 
 screen_update_ns = 250 * 1000 * 1000
-last_seen_update_ns = time.monotonic_ns()
 
 stale_time_ns = 65 * 1000 * 1000 * 1000
 scan_time_s = 10
 
+### Log of the devices seen in a file of fixed size, the oldest records are overwritten
+### The CIRCUITPY drive must be writable by CircuitPython (see capture_recorder.py)
+log_path = None   ### "/scanlog.bin"
+log_size = 128 * 1024
+
+### Binary telemetry on the second USB serial, watch it with tools/watch_telemetry.py
+### (needs usb_cdc.enable(console=True, data=True) in boot.py), it replace the debug
+### print of every advertisement
+telemetry = None
+try:
+    import usb_cdc
+    if usb_cdc.data is not None:
+        telemetry = Telemetry(usb_cdc.data)
+except (ImportError, AttributeError):
+    pass
+
 ble = BLERadio()
 ble.name = "CPB"
 
-count = 1
-
 complete_names_count = {}
-addresses_count = {}
 oui_count = {}
 
-### An array of timestamp and advertisement by key (addr)
-last_ad_by_key = {}
-
-c_name_by_addr = {}
-
-def remove_old(ad_by_key, expire_time_ns):
-    """Delete any entry in the ad_by_key dict with a timestamp older than expire_time_ns."""
-    ### the list() is needed to make a real list from the iterator 
-    ### which allows modification of the dict inside the loop
-    for key, value in list(ad_by_key.items()):
-        if value[1] < expire_time_ns:
-            del ad_by_key[key]
-
-
-### TODO: arg list is getting big here
-def update_screen(disp, rows_g, rows_n, ad_by_key, then_ns,
-                  sum_dob, tot_mac, tot_oui, tot_names,
-                  *,
-                  mem_free=None):
-    """Update the screen with the entries with highest RSSI, recenctly seen.
-       The text colour is used to indicate how recent.
-       """
-
-    if mem_free is None:
-        summary_text = "MACs:{:<4d}  OUIs:{:<4d}  Names:{:<4d}".format(tot_mac,
-                                                                       tot_oui,
-                                                                       tot_names)
+### Different addresses seen in the last 1, 5, 15 and 60 minutes (fixed memory,
+### a dictionary of all the addresses would grow until the memory is full)
+distinct = DistinctCounter()
+
+### Maximum number of addresses tracked at the same time (the oldest is forgotten)
+tracked = 40
+
+
+def count_advert(scanner, row, entry, now_ns):
+    """Count the OUIs and names, keep the complete name in the table."""
+    ### The address bytes are used as key, no text formatting here
+    addr_key = entry.address.address_bytes
+
+    ### The bytes are in reverse order, the OUI is at the end
+    oui = addr_key[3:]
+    try:
+        oui_count[oui] += 1
+    except KeyError:
+        oui_count[oui] = 1
+
+    c_name = complete_name(entry.advertisement_bytes)
+    if c_name is not None:
+        scanner.devices.names[row] = c_name
+        try:
+            complete_names_count[c_name] += 1
+        except KeyError:
+            complete_names_count[c_name] = 1
+
+    if telemetry is not None:
+        telemetry.advert(row, entry, now_ns)
     else:
-        summary_text = "MACs:{:<4d}  OUIs:{:<4d}  Names:{:<4d} M:{:<3d}".format(tot_mac,
-                                                                                tot_oui,
-                                                                                tot_names,
-                                                                                round(mem_free/1024.0))
-
-    sum_dob.text = summary_text
-
-    ### Sort by the RSSI field, then the time field
-    sorted_data = sorted(ad_by_key.items(),
-                         key=lambda item: (item[1][2], item[1][1]),
-                         reverse=True)
-
-    ### Add the top N rows to to the screen
-    ### the key is the mac address as text without any colons
-    idx = 0
-    for key, value in sorted_data[:rows_n]:
-        ad, ad_time_ns, rssi = value
-        ### Add the colon sepators to the string version of the MAC address
-        if data_mask == 0:
-            masked_mac = key
-        elif data_mask == 1:
-            masked_mac = key[0:6] + "------"
-        else:
-            masked_mac = "------------"
-        mac_text = ":".join([masked_mac[off:off+2] for off in range(0, len(masked_mac), 2)])
-        ##name = ad.complete_name
-        name = c_name_by_addr.get(key)
-        if name is None:
-            name = "?"
-        ### Must be careful not to exceed the fixed max_glyphs field size here (40)
-        rows_g[idx].text = "{:16s} {:s} {:4d}".format(name[:16],
-                                                      mac_text,  ### should be 17 chars
-                                                      rssi)
-        ### This should be from 0 to about 65s-75s
-        age = 170 - (then_ns - ad_time_ns) / stale_time_ns * 170
-        brightness = min(max(round(85 + age * 2.4), 0), 255)
-        rows_g[idx].color = (brightness, brightness, 0)
-        idx += 1    
-
-    #### Blank out any rows not populated with data
-    if idx < rows_n:
-        for _ in range(rows_n - idx):
-            rows_g[idx].text = ""
+        d_print(4,
+                entry.address, entry.rssi, entry.scan_response,
+                entry.advertisement_bytes)
 
 
-while True:
-    d_print(2, "Loop", count)
-    for ad in ble.start_scan(minimum_rssi=-127, timeout=scan_time_s):
-        now_ns = time.monotonic_ns()
+### Bytes per advertisement (A) and per refresh (R), number of collections and the
+### longest one, and worst loop latency (L)
+stats = LoopStats()
 
-### This filter out all the BLE advertisement that are not 
-        if 3 in ad.data_dict:
-            if ad.data_dict[3] == b'o\xfd':
 
-                ##addr_b = ad.address.address_bytes
-                c_name = ad.complete_name
-                addr_text = "".join(["{:02x}".format(b) for b in reversed(ad.address.address_bytes)])
+def summary_text(scanner):
+    """The addresses seen recently, the totals and the free memory, then the loop statistics."""
+    stats.collect()
+    mem_free = gc.mem_free()
+    seen = distinct.counts(scanner.clock())
+    return ("Seen 1m:{:<4d} 5m:{:<4d} 15m:{:<4d} 1h:{:<4d}\n"
+            "OUIs:{:<4d}  Names:{:<4d}  M:{:<3d}\n{:s}").format(seen[0], seen[1], seen[2], seen[3],
+                                                              len(oui_count),
+                                                              len(complete_names_count),
+                                                              round(mem_free/1024.0),
+                                                              stats.text())
 
-                last_ad_by_key[addr_text] = (ad, now_ns, ad.rssi)
 
-                try:
-                    addresses_count[addr_text] += 1
-                except KeyError:
-                    addresses_count[addr_text] = 1
+### The rows with highest RSSI, the text colour is used to indicate how recent
+labels = LabelOutput(rows_group, rows, stale_time_ns,
+                     summary_label=summary_label, summary=summary_text)
 
-                oui = addr_text[:6]
-                try:
-                    oui_count[oui] += 1
-                except KeyError:
-                    oui_count[oui] = 1
-    
-                if c_name is not None:
-                    c_name_by_addr[addr_text] = c_name
-                    try:
-                        complete_names_count[c_name] += 1
-                    except KeyError:
-                        complete_names_count[c_name] = 1      
-
-        if button_right():
-            data_mask = (data_mask + 1 ) % DATA_MASK_LEVELS
-            while button_right():
-                pass
-
-        if button_left():
-            debug_mem_free = gc.mem_free()
-            print("Memfree: ", debug_mem_free)
-            while button_left():
-                pass
-
-        if now_ns - last_seen_update_ns > screen_update_ns:
-            gc.collect()
-            mem_free = gc.mem_free()
-            update_screen(display, rows_group, rows, last_ad_by_key,
-                         now_ns,
-                         summary_label,
-                         len(addresses_count), len(oui_count), len(complete_names_count),
-                         mem_free=mem_free)
-
-            last_seen_update_ns = now_ns
 
-        d_print(4,
-                ad.address, ad.rssi, ad.scan_response,
-                ad.tx_power, ad.complete_name, ad.short_name)
+def check_buttons(scanner, now_ns):
+    """Right button hide more of the MAC addresses, left one print the loop statistics (and write the log)."""
+    if button_right():
+        labels.next_mask()
+        while button_right():
+            pass
+
+    if button_left():
+        stats.dump()
+        if scanner.log is not None:
+            scanner.log.sync()
+            print("Log:", scanner.log.records, "records", scanner.log.max_flush_ns // 1000, "us max flush")
+        while button_left():
+            pass
+
 
+### The devices seen, only the RSSI, timestamp and complete name are kept
+### (nothing is hidden, the RSSI is shown until the device is forgotten)
+scanner = Scanner(rows, [labels] if telemetry is None else [labels, telemetry],
+                  hide_time_ns=stale_time_ns, stale_time_ns=stale_time_ns, scan_time_s=scan_time_s,
+                  refresh_ns=screen_update_ns, tracked=tracked, names=True,
+                  on_advert=count_advert, on_loop=check_buttons, stats=stats,
+                  distinct=distinct, log=FlashLog(log_path, log_size) if log_path else None)
 
-    remove_old(last_ad_by_key, time.monotonic_ns() - stale_time_ns)
+count = 1
+while True:
+    d_print(2, "Loop", count)
+    scanner.scan()
 
     d_print(2,
-            "MACS", len(addresses_count),
+            "SEEN", distinct.counts(),
             "OUI", len(oui_count),
             "NAMES", len(complete_names_count))
 
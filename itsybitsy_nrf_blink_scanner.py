@@ -42,21 +42,23 @@ import adafruit_dotstar as dotstar
 
 ### https://github.com/adafruit/Adafruit_CircuitPython_BLE
 from adafruit_ble import BLERadio
-from adafruit_ble.advertising.standard import Advertisement
+
+### Shared scanner code (copy lib/contact_scanner to the lib directory of the board)
+from contact_scanner.engine import Scanner
+from contact_scanner.outputs import BlinkOutput
+### The scan, the count and the blink are separate asyncio tasks
+### (copy the asyncio and adafruit_ticks libraries to the lib directory of the board)
+from contact_scanner.runtime import Runtime
+from contact_scanner.schedule import ScanSchedule
 
 import digitalio
 
-# Number of blink
-BLINK_COUNT = 0
 # How long we want to wait between blinking
 BLINK_PAUSE_DURATION = 5
 # How long we want the LED to stay on
 BLINK_ON_DURATION = 0.2
 # How long we want the LED to stay off
 BLINK_OFF_DURATION = 0.2
-# When we last changed the LED state
-LAST_BLINK_TIME = -1
-LAST_SLEEP_TIME = -1
 # Setup the LED pin.
 led = digitalio.DigitalInOut(board.BLUE_LED)
 led.direction = digitalio.Direction.OUTPUT
@@ -71,10 +73,6 @@ led.direction = digitalio.Direction.OUTPUT
 
 ### The number of rows is also the number of NEOPIXEL (or DotStar)
 rows = 10
-### This is the value used when we don't know what RGB LED to use yet
-NO_IDX = -1
-### Address that do not advertise anymore get a very low RSSI to indicate that
-NOT_RSSI = -127
 
 ### This is just to show then CPE start (or restart)
 BRIGHTNESS = 1
@@ -94,117 +92,22 @@ hide_time_ns =      20 * 1000 * 1000 * 1000
 stale_time_ns =    200 * 1000 * 1000 * 1000
 scan_time_s = 10
 
-last_seen_update_ns = time.monotonic_ns()
-# Reintroduce screen_update_ns to limit call to change color
-screen_update_ns = 1 * 1000 * 1000 * 1000
 ### Time before not blinking for a phone that does not advertise anymore
 noblink_time_ns =      10 * 1000 * 1000 * 1000
 
 ble = BLERadio()
 ble.name = "ItsyBitsy"
 
-### An array of timestamp and advertisement by key (addr)
-last_ad_by_key = {}
-
-
-def delete_very_old(rows_n, ad_by_key):
-    """Delete older key above the number of rows_n"""
-    ### If we have more entry than space
-    if len(ad_by_key)>rows_n:
-        ### Sort by last seen to identify earliest that should be cleaned
-        sorted_data = sorted(ad_by_key.items(), key=lambda item: (item[1][1]))
-        ### Number of entries to remove
-        to_delete = len(ad_by_key)-rows_n
-        ### Iterate on the first entry and delete them from the list received
-        for key, value in sorted_data[:to_delete]:
-            ### Delete such entry
-            del ad_by_key[key]
-
-
-def hide_old(ad_by_key, hide_time_ns):
-    """Hide any entry in the ad_by_key dict with a timestamp older than hide_time_ns. (setting RSSI to -255)"""
-    ### the list() is needed to make a real list from the iterator
-    ### which allows modification of the dict inside the loop
-    for key, value in list(ad_by_key.items()):
-        if value[1] < hide_time_ns:
-            ad_by_key[key] = (value[0], value[1], NOT_RSSI, value[3])
-
-
-def remove_old(ad_by_key, expire_time_ns):
-    """Delete any entry in the ad_by_key dict with a timestamp older than expire_time_ns."""
-    ### the list() is needed to make a real list from the iterator
-    ### which allows modification of the dict inside the loop
-    for key, value in list(ad_by_key.items()):
-        if value[1] < expire_time_ns:
-            del ad_by_key[key]
-
-
-def count_active(rows_n, ad_by_key, then_ns):
-    """Count the number ."""
-    active = 0
-    ### Sort by the MAC field
-    sorted_data = sorted(ad_by_key.items(), key=lambda item: (item[0]))
-    ### Scan all element to display the color
-    for key, value in sorted_data[:rows_n]:
-        ad, ad_time_ns, rssi, index_col = value
-        age_ns = then_ns - ad_time_ns
-        if rssi != NOT_RSSI:
-            if age_ns < noblink_time_ns:
-                active = active + 1
-    return (active)
-
-
-blink_todo = BLINK_COUNT
-
-while True:
-    ### For all the advertisement
-    for ad in ble.start_scan(minimum_rssi=-127, timeout=scan_time_s):
-        ### Take the timestamp
-        now_ns = time.monotonic_ns()
-        ### If this is a contact tracing advertisement
-        if 3 in ad.data_dict:
-            if ad.data_dict[3] == b'o\xfd':
-                ### Found a Contact Tracing advertisement.
-                addr_text = "".join(["{:02x}".format(b) for b in reversed(ad.address.address_bytes)])
-                if addr_text in last_ad_by_key:
-                    ### Updating existing entry with a new timestamp
-                    last_ad_by_key[addr_text] = (ad, now_ns, ad.rssi, last_ad_by_key[addr_text][3])
-                else:
-                    ### Creating a new entry, but we don't know what RGB LED to use yet, so NO_IDX
-                    last_ad_by_key[addr_text] = (ad, now_ns, ad.rssi, NO_IDX)
-#
-        delete_very_old(rows, last_ad_by_key)
-        hide_old(last_ad_by_key, time.monotonic_ns() - hide_time_ns)
-        remove_old(last_ad_by_key, time.monotonic_ns() - stale_time_ns)
-#### This will be the number of blink
-
-        BLINK_COUNT = count_active(rows, last_ad_by_key, now_ns)
-
-#         value = count_active(rows, last_ad_by_key, now_ns)
-# #### Not really needed to delay updating
-#         if now_ns - last_seen_update_ns > screen_update_ns:
-#             last_seen_update_ns = now_ns
-#             BLINK_COUNT = value
-
-#### Blinking logic without sleep, based on https://learn.adafruit.com/multi-tasking-with-circuitpython
-
-        # Store the current time to refer to later.
-        now = time.monotonic()
-        if blink_todo > 0:
-            if not led.value:
-                # Is it time to turn on?
-                if now >= LAST_BLINK_TIME + BLINK_OFF_DURATION:
-                    led.value = True
-                    LAST_BLINK_TIME = now
-            if led.value:
-                # Is it time to turn off?
-                if now >= LAST_BLINK_TIME + BLINK_ON_DURATION:
-                    led.value = False
-                    LAST_BLINK_TIME = now
-                    blink_todo = blink_todo - 1
-                    LAST_SLEEP_TIME = now
-        else:
-            if now >= LAST_SLEEP_TIME + BLINK_PAUSE_DURATION:
-                LAST_SLEEP_TIME = now
-                blink_todo = BLINK_COUNT
-                #print("Next blinking scheduled: ", blink_todo)
+### The number of blink is the number of phones that advertised recently
+blink = BlinkOutput(led,
+                    active_ns=noblink_time_ns,
+                    on_ns=int(BLINK_ON_DURATION * 1000000000),
+                    off_ns=int(BLINK_OFF_DURATION * 1000000000),
+                    pause_ns=BLINK_PAUSE_DURATION * 1000 * 1000 * 1000)
+
+### Scan forever, the LED keep blinking even when no advertisement is received
+### (and while the radio is off, the scan duty cycle follow the crowd to save battery)
+scanner = Scanner(rows, [blink],
+                  hide_time_ns=hide_time_ns, stale_time_ns=stale_time_ns,
+                  scan_time_s=scan_time_s, schedule=ScanSchedule())
+Runtime(scanner).run()
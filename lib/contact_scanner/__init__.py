@@ -0,0 +1,5 @@
+### CoronAlert Scanner shared code
+### Copy the contact_scanner directory to the lib directory of the CIRCUITPY drive
+
+### Copyright (c) 2020 David Glaude
+### MIT License
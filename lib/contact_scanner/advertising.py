@@ -0,0 +1,85 @@
+### CoronAlert Scanner raw advertisement parsing
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Look at the raw bytes of an advertisement without decoding it.
+
+adafruit_ble build an Advertisement with a dict of all the AD structures
+for every advertisement received, even the ones that are not Exposure
+Notification. These functions walk the bytes of ScanEntry.advertisement_bytes
+once and stop as soon as they know the answer, without allocating.
+
+An Exposure Notification advertisement contains:
+ 03 03 6F FD        complete list of 16-bit service UUID: 0xFD6F
+ 17 16 6F FD + 20   service data for 0xFD6F: 16 bytes RPI + 4 bytes AEM
+both are needed to be taken as Exposure Notification.
+"""
+
+### AD types
+_COMPLETE_LIST_16BIT_UUID = 0x03
+_COMPLETE_NAME = 0x09
+_SERVICE_DATA_16BIT_UUID = 0x16
+
+### Exposure Notification service UUID 0xFD6F (little endian)
+_EN_UUID_LO = 0x6F
+_EN_UUID_HI = 0xFD
+
+### Length of the service data payload (RPI + AEM)
+EN_PAYLOAD_LENGTH = 20
+
+
+def is_exposure_notification(adv):
+    """Return True if the advertisement list the Exposure Notification service and has its service data."""
+    i = 0
+    end = len(adv) - 4
+    listed = False
+    data = False
+    while i <= end:
+        length = adv[i]
+        if length == 0:
+            return False
+        if length >= 3 and adv[i + 2] == _EN_UUID_LO and adv[i + 3] == _EN_UUID_HI:
+            ad_type = adv[i + 1]
+            if ad_type == _COMPLETE_LIST_16BIT_UUID and length == 3:
+                listed = True
+            elif ad_type == _SERVICE_DATA_16BIT_UUID:
+                data = True
+            if listed and data:
+                return True
+        i += length + 1
+    return False
+
+
+def en_payload(adv):
+    """Return a memoryview on the 20 bytes of Exposure Notification service data (or None)."""
+    i = 0
+    end = len(adv) - 4 - EN_PAYLOAD_LENGTH
+    while i <= end:
+        length = adv[i]
+        if length == 0:
+            return None
+        if (length == 3 + EN_PAYLOAD_LENGTH and adv[i + 1] == _SERVICE_DATA_16BIT_UUID
+                and adv[i + 2] == _EN_UUID_LO and adv[i + 3] == _EN_UUID_HI):
+            return memoryview(adv)[i + 4:i + 4 + EN_PAYLOAD_LENGTH]
+        i += length + 1
+    return None
+
+
+def complete_name(adv):
+    """Return the complete name of the advertisement as a str (or None)."""
+    i = 0
+    end = len(adv) - 1
+    while i < end:
+        length = adv[i]
+        if length == 0:
+            return None
+        if adv[i + 1] == _COMPLETE_NAME:
+            try:
+                return str(adv[i + 2:i + 1 + length], "utf-8")
+            except UnicodeError:
+                ### Not a valid name, the advertisement is cut or garbled
+                return None
+        i += length + 1
+    return None
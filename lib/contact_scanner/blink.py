@@ -0,0 +1,87 @@
+### CoronAlert Scanner blink pattern
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Blink a LED N times, then pause, on a fixed time line.
+
+The pattern of a cycle is known as soon as it start: 'count' times on
+for on_ns and off for off_ns, the last off being the pause. Each change
+of the LED has its time (next_ns), computed from the time of the previous
+change and not from the time it was noticed, so the blinks do not drift
+when the calls come late (a busy scan) and a call only compare the time
+with next_ns. The Runtime sleep until next_ns, instead of checking the
+time every few ms.
+
+A new count (set_count) is a single assignment, it is used from the next
+cycle, so a cycle is never cut.
+
+pwmio can not do this: the nRF52840 PWM can not go below a few Hz, and
+can not make a pause after N blinks.
+"""
+
+
+class BlinkPattern:
+    """The on/off time line of 'count' blinks then a pause, for one LED."""
+
+    def __init__(self, led, *, on_ns=200 * 1000 * 1000, off_ns=200 * 1000 * 1000,
+                 pause_ns=5 * 1000 * 1000 * 1000, max_count=50):
+        self.led = led
+        self.on_ns = on_ns
+        self.off_ns = off_ns
+        self.pause_ns = pause_ns
+        self.max_count = max_count
+        self.count = 0
+        ### Blinks of the current cycle, and the phase in it (2 phases per blink)
+        self._blinks = 0
+        self._phase = 0
+        self.next_ns = None
+        self.cycles = 0
+        self.late = 0
+
+    def set_count(self, count):
+        """Number of blinks of the next cycles."""
+        self.count = count if count < self.max_count else self.max_count
+
+    def _start_cycle(self):
+        self._blinks = self.count
+        self._phase = 0
+        self.cycles += 1
+
+    def update(self, now_ns):
+        """Set the LED for now_ns, return the time of its next change."""
+        next_ns = self.next_ns
+        if next_ns is not None and now_ns < next_ns:
+            return next_ns
+        if next_ns is None:
+            ### First call, the first cycle start now
+            next_ns = now_ns
+            self._phase = 2 * self._blinks
+        elif now_ns - next_ns > self.pause_ns:
+            ### Not called for a long time, the time line start again from now
+            next_ns = now_ns
+            self.late += 1
+        while next_ns <= now_ns:
+            if self._phase == 2 * self._blinks:
+                ### End of the pause
+                self._start_cycle()
+            if self._blinks == 0:
+                ### Nothing to blink, wait for one more pause
+                self.led.value = False
+                self._phase = 0
+                next_ns += self.pause_ns
+                continue
+            phase = self._phase
+            self._phase = phase + 1
+            if phase & 1 == 0:
+                self.led.value = True
+                next_ns += self.on_ns
+            else:
+                self.led.value = False
+                next_ns += self.pause_ns if self._phase == 2 * self._blinks else self.off_ns
+            if next_ns <= now_ns:
+                ### Too late for that change, the time line is kept
+                self.late += 1
+        self.next_ns = next_ns
+        return next_ns
@@ -0,0 +1,209 @@
+### CoronAlert Scanner capture and replay
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Record the raw scan entries on a board, replay them on a computer.
+
+A capture file start with MAGIC, followed by one record per scan entry:
+the RECORD header (time in ms since the start of the capture, address
+type, the 6 address bytes, RSSI, flags and length of the advertisement)
+then the raw advertisement bytes.
+
+On the board, RecordingAdapter is put in front of _bleio.adapter:
+
+    scanner = Scanner(rows, outputs, adapter=RecordingAdapter(_bleio.adapter, file))
+
+On a computer, ReplayAdapter give the same entries back, with a clock
+that follows the time of the capture (as fast as possible, or in real
+time), so the Scanner and its outputs run unchanged and the results are
+the same at every run:
+
+    replay = ReplayAdapter(open("capture.bin", "rb"))
+    scanner = Scanner(rows, outputs, adapter=replay, clock=replay.clock)
+    while not replay.done:
+        scanner.scan()
+"""
+
+import struct
+import time
+
+MAGIC = b"ENCP\x01"
+### t_ms, address type, address, RSSI, flags, length of the advertisement
+RECORD = "<IB6sbBB"
+RECORD_SIZE = struct.calcsize(RECORD)
+FLAG_SCAN_RESPONSE = 0x01
+
+
+def pack_record(t_ms, entry):
+    """The bytes of the record of one scan entry."""
+    adv = entry.advertisement_bytes
+    address = entry.address
+    return struct.pack(RECORD,
+                       t_ms,
+                       address.type,
+                       address.address_bytes,
+                       entry.rssi,
+                       FLAG_SCAN_RESPONSE if entry.scan_response else 0,
+                       len(adv)) + bytes(adv)
+
+
+class RecordingAdapter:
+    """Wrap an adapter, write every scan entry to stream before giving it to the scanner.
+
+    The records are kept in a buffer written every flush_size bytes, so
+    the flash is not written for every advertisement.
+    """
+
+    def __init__(self, adapter, stream, *, clock=time.monotonic_ns, flush_size=512):
+        self.adapter = adapter
+        self.stream = stream
+        self.clock = clock
+        self.flush_size = flush_size
+        self.records = 0
+        self._start_ns = None
+        self._buffer = bytearray()
+        stream.write(MAGIC)
+
+    def record(self, entry, now_ns):
+        """Add one scan entry to the capture."""
+        if self._start_ns is None:
+            self._start_ns = now_ns
+        self._buffer.extend(pack_record((now_ns - self._start_ns) // 1000000, entry))
+        self.records += 1
+        if len(self._buffer) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records."""
+        if self._buffer:
+            self.stream.write(self._buffer)
+            self._buffer = bytearray()
+            self.stream.flush()
+
+    def start_scan(self, *args, **kwargs):
+        """Same as adapter.start_scan(), recording the entries."""
+        for entry in self.adapter.start_scan(*args, **kwargs):
+            self.record(entry, self.clock())
+            yield entry
+        self.flush()
+
+
+class ReplayAddress:
+    """What the scanners use of _bleio.Address."""
+
+    def __init__(self, address_bytes, address_type):
+        self.address_bytes = address_bytes
+        self.type = address_type
+
+    def __str__(self):
+        return "<Address {}>".format(":".join("{:02x}".format(b) for b in reversed(self.address_bytes)))
+
+
+class ReplayEntry:
+    """What the scanners use of _bleio.ScanEntry."""
+
+    def __init__(self, address, rssi, advertisement_bytes, scan_response):
+        self.address = address
+        self.rssi = rssi
+        self.advertisement_bytes = advertisement_bytes
+        self.scan_response = scan_response
+
+
+def read_capture(stream):
+    """Yield (t_ms, ReplayEntry) for every record of a capture file."""
+    if stream.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not a capture file")
+    while True:
+        header = stream.read(RECORD_SIZE)
+        if len(header) < RECORD_SIZE:
+            return
+        t_ms, address_type, address_bytes, rssi, flags, length = struct.unpack(RECORD, header)
+        adv = stream.read(length)
+        if len(adv) < length:
+            return
+        yield t_ms, ReplayEntry(ReplayAddress(address_bytes, address_type), rssi, adv,
+                                bool(flags & FLAG_SCAN_RESPONSE))
+
+
+class ReplayClock:
+    """Time of the capture being replayed, used as the clock of the Scanner."""
+
+    def __init__(self, start_ns=0):
+        self.now_ns = start_ns
+
+    def __call__(self):
+        return self.now_ns
+
+
+class ReplayAdapter:
+    """Give back the entries of a capture like _bleio.adapter.start_scan().
+
+    Each start_scan() returns the entries of the next 'timeout' seconds of
+    the capture, done is True once all of them were given. With
+    realtime=True the entries are given at the pace they were received,
+    otherwise as fast as possible. In both cases clock follows the time of
+    the capture, so the results do not depend on the speed of the computer.
+    records can be a capture stream or any iterable of (t_ms, entry).
+    """
+
+    def __init__(self, records, *, realtime=False, clock=None):
+        if hasattr(records, "read"):
+            records = read_capture(records)
+        self._records = iter(records)
+        self._pending = None
+        self.realtime = realtime
+        self.clock = ReplayClock() if clock is None else clock
+        self.entries = 0
+        self.done = False
+        self._wall_start_ns = None
+        self._start_ns = self.clock.now_ns
+
+    def _next(self):
+        if self._pending is None:
+            try:
+                self._pending = next(self._records)
+            except StopIteration:
+                self.done = True
+        return self._pending
+
+    def start_scan(self, prefixes=b"", *, timeout=None, minimum_rssi=-80,
+                   interval=0.1, window=0.1, **kwargs):
+        """Replay the next timeout seconds of the capture (all of it if timeout is None).
+
+        Like the adapter, entries below minimum_rssi are not given, and only
+        the entries received during the first 'window' seconds of every
+        'interval' seconds are given. prefixes and the other arguments are
+        accepted but not used (the scanners filter the advertisements
+        themselves).
+        """
+        scan_start_ns = self.clock.now_ns
+        window_end_ns = None
+        if timeout is not None:
+            window_end_ns = scan_start_ns + int(timeout * 1000000000)
+        interval_ns = int(interval * 1000000000)
+        listen_ns = int(window * 1000000000)
+        while True:
+            record = self._next()
+            if record is None:
+                return
+            t_ms, entry = record
+            t_ns = self._start_ns + t_ms * 1000000
+            if window_end_ns is not None and t_ns > window_end_ns:
+                self.clock.now_ns = window_end_ns
+                return
+            self._pending = None
+            if self.realtime:
+                if self._wall_start_ns is None:
+                    self._wall_start_ns = time.monotonic_ns() - (t_ns - self._start_ns)
+                wait_ns = self._wall_start_ns + (t_ns - self._start_ns) - time.monotonic_ns()
+                if wait_ns > 0:
+                    time.sleep(wait_ns / 1000000000)
+            self.clock.now_ns = t_ns
+            if entry.rssi < minimum_rssi:
+                continue
+            if listen_ns < interval_ns and (t_ns - scan_start_ns) % interval_ns >= listen_ns:
+                continue
+            self.entries += 1
+            yield entry
@@ -0,0 +1,52 @@
+### CoronAlert Scanner burst coalescing
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Absorb the repeated advertisements of a device before the table.
+
+A phone advertise every 200-270ms, so a phone next to the scanner send
+four or more advertisements per second. The first advertisement of a
+device is given to the table, the next ones received during window_ns
+only keep their highest RSSI. The first advertisement after the window
+update the table again, with the highest RSSI seen since the last update.
+
+The table is only updated once per window for each device, so its work
+follow the number of devices, not the number of advertisements. The last
+seen time of a device can be up to window_ns early (keep it well below
+the hide time).
+"""
+
+import array
+
+from contact_scanner.table import NOT_RSSI
+
+
+class Coalescer:
+    """Coalesce the advertisements of each row of a DeviceTable."""
+
+    def __init__(self, capacity, window_ns):
+        self.window_ms = window_ns // 1000000
+        ### Per row: end of the window (table time base) and highest RSSI absorbed
+        self.until_ms = array.array("L", [0] * capacity)
+        self.peak = array.array("b", [NOT_RSSI] * capacity)
+        self.absorbed = 0
+        self.forwarded = 0
+
+    def update(self, table, key, now_ns, rssi):
+        """Record an advertisement for key, return (row, True if the table was updated)."""
+        row = table.row_by_key.get(key)
+        if row is not None:
+            if table.to_ms(now_ns) < self.until_ms[row]:
+                if rssi > self.peak[row]:
+                    self.peak[row] = rssi
+                self.absorbed += 1
+                return row, False
+            if self.peak[row] > rssi:
+                rssi = self.peak[row]
+        row = table.update(key, now_ns, rssi)
+        self.until_ms[row] = table.last_ms[row] + self.window_ms
+        self.peak[row] = NOT_RSSI
+        self.forwarded += 1
+        return row, True
@@ -0,0 +1,68 @@
+### CoronAlert Scanner colour lookup tables
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Colour of a device from its RSSI, or from its age once it is hidden.
+
+The thresholds (RSSI_VALUE, TIME_BLUE) and colours (RSSI_COLOR, SHADE_BLUE...)
+of the scanners are compiled once into two tables of packed 0xRRGGBB colours,
+accepted as is by NeoPixel, DotStar, NeoTrellis and displayio Palette:
+ * by RSSI, one entry per RSSI value from -127 to 0
+ * by age, one entry per bucket of 2**age_shift milliseconds
+so finding the colour of a device is a single lookup.
+"""
+
+import array
+
+from contact_scanner.pixels import pack_color
+
+### Address that do not advertise anymore get a very low RSSI to indicate that
+NOT_RSSI = -127
+
+
+class ColorTable:
+    """Lookup tables for the colour policy of a scanner.
+
+    time_blue are in nanosecond (like in the scanners), the age given to
+    color() is in millisecond. With the default age_shift of 10 the age is
+    rounded down to about one second.
+    """
+
+    def __init__(self, rssi_value, rssi_color, rssi_default_color,
+                 time_blue, shade_blue, mini_blue, *, age_shift=10):
+        self.age_shift = age_shift
+        ### RSSI -127..0 -> colour, first threshold above the RSSI wins
+        self.by_rssi = array.array("l", [0] * 128)
+        for rssi in range(-127, 1):
+            color = rssi_default_color
+            for i, value in enumerate(rssi_value):
+                if rssi < value:
+                    color = rssi_color[i]
+                    break
+            self.by_rssi[rssi + 127] = pack_color(color)
+        ### age bucket -> colour, for the hidden devices
+        time_blue_ms = [t // 1000000 for t in time_blue]
+        buckets = (time_blue_ms[-1] >> age_shift) + 1 if time_blue_ms else 0
+        self.by_age = array.array("l", [0] * buckets)
+        for bucket in range(buckets):
+            age_ms = bucket << age_shift
+            color = mini_blue
+            for i, limit_ms in enumerate(time_blue_ms):
+                if age_ms < limit_ms:
+                    color = shade_blue[i]
+                    break
+            self.by_age[bucket] = pack_color(color)
+        self.oldest_color = pack_color(mini_blue)
+
+    def color(self, age_ms, rssi):
+        """Decide color based on rssi and age_ms (packed 0xRRGGBB)."""
+        if rssi == NOT_RSSI:
+            bucket = age_ms >> self.age_shift
+            if bucket < len(self.by_age):
+                return self.by_age[bucket]
+            return self.oldest_color
+        if rssi > 0:
+            rssi = 0
+        return self.by_rssi[rssi + 127]
@@ -0,0 +1,125 @@
+### CoronAlert Scanner sliding window distinct counts
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Number of different addresses seen in the last 1, 5, 15 and 60 minutes.
+
+Keeping every address seen is not possible for long on a board. Instead
+each slice of time (one minute) has a small bitmap, an address set the bit
+given by its first bytes. The number of addresses in a bitmap is estimated
+from the share of bits still at zero (linear counting):
+
+    count = -bits * ln(zero bits / bits)
+
+A window is the union (OR) of the slice being filled and of the last
+finished slices (so it cover between the window and the window plus one
+slice). The unions of the finished slices are only made when a count is
+asked, once per slice (each window start from the union of the shorter
+one), so adding an address is a single bit set and never wait for them.
+The Scanner start the new slices at the refresh (advance() in maintain),
+and the outputs ask the counts at their render. The memory is fixed: one
+bitmap per slice of the longest window.
+
+A phone changing its random address count as a new address.
+"""
+
+import math
+
+### Number of bits set in each byte value
+_BITS = bytes(bin(value).count("1") for value in range(256))
+
+WINDOWS_S = (60, 300, 900, 3600)
+
+
+class DistinctCounter:
+    """Estimate of the distinct addresses seen in sliding windows.
+
+    windows_s must be multiples of slice_s, shortest first. With 512 bits per slice the
+    estimate is within a few % up to about a thousand addresses per window,
+    and saturate around 3000 (use more bits for a busy place).
+    """
+
+    def __init__(self, windows_s=WINDOWS_S, *, slice_s=60, bits=512):
+        self.windows = [window_s // slice_s for window_s in windows_s]
+        self.windows_s = windows_s
+        self.slice_ns = slice_s * 1000000000
+        self.bits = bits
+        self._mask = bits - 1
+        size = bits // 8
+        ### One bitmap per slice, _slices[_current] is being filled
+        self._slices = [bytearray(size) for _ in range(max(self.windows) + 1)]
+        self._current = 0
+        self._slice_end_ns = None
+        ### Union of the finished slices of each window (the one being filled is not in it)
+        self._unions = [bytearray(size) for _ in self.windows]
+        ### The unions are made for the slices finished (False after a new slice)
+        self._unions_done = True
+
+    def add(self, key, now_ns):
+        """Count the address key seen at now_ns."""
+        self.advance(now_ns)
+        bit = (key[0] | key[1] << 8) & self._mask
+        self._slices[self._current][bit >> 3] |= 1 << (bit & 7)
+
+    def advance(self, now_ns):
+        """Start the new slices up to now_ns."""
+        if self._slice_end_ns is None:
+            self._slice_end_ns = now_ns + self.slice_ns
+            return
+        if now_ns < self._slice_end_ns:
+            return
+        slices = self._slices
+        count = len(slices)
+        while now_ns >= self._slice_end_ns:
+            self._slice_end_ns += self.slice_ns
+            self._current = (self._current + 1) % count
+            bitmap = slices[self._current]
+            for i in range(len(bitmap)):
+                bitmap[i] = 0
+        self._unions_done = False
+
+    def _make_unions(self):
+        """Union of the finished slices of each window, from the union of the shorter one."""
+        slices = self._slices
+        count = len(slices)
+        size = len(self._unions[0])
+        previous = None
+        back = 1
+        for union, window in zip(self._unions, self.windows):
+            if previous is None:
+                for i in range(size):
+                    union[i] = 0
+            else:
+                for i in range(size):
+                    union[i] = previous[i]
+            while back <= window:
+                bitmap = slices[(self._current - back) % count]
+                for i in range(size):
+                    union[i] |= bitmap[i]
+                back += 1
+            previous = union
+        self._unions_done = True
+
+    def count(self, window, now_ns=None):
+        """Estimated distinct addresses in window (index in windows_s)."""
+        if now_ns is not None:
+            self.advance(now_ns)
+        if not self._unions_done:
+            self._make_unions()
+        current = self._slices[self._current]
+        finished = self._unions[window]
+        zeros = 0
+        for i in range(len(current)):
+            zeros += 8 - _BITS[finished[i] | current[i]]
+        if zeros == 0:
+            ### Saturated, more than the bitmap can tell
+            zeros = 1
+        return round(-self.bits * math.log(zeros / self.bits))
+
+    def counts(self, now_ns=None):
+        """Estimated distinct addresses in all the windows."""
+        if now_ns is not None:
+            self.advance(now_ns)
+        return [self.count(window) for window in range(len(self.windows))]
@@ -0,0 +1,217 @@
+### CoronAlert Scanner engine
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+The scan loop shared by all the scanners.
+
+The Scanner own the scanning, the Exposure Notification filter, the device
+table and the pace of the refresh. What is shown (NeoPixel, DotStar,
+NeoTrellis, CLUE screen, blinking LED...) is done by the outputs, see
+contact_scanner.outputs.
+
+    scanner = Scanner(rows, [PixelOutput(strip, rows, colors)])
+    scanner.run()
+"""
+
+import time
+
+from contact_scanner.table import DeviceTable
+from contact_scanner.coalesce import Coalescer
+from contact_scanner.linker import RotationLinker
+from contact_scanner.smooth import RssiFilter
+from contact_scanner.advertising import is_exposure_notification
+
+### If no advertisement received for 'hide_time_ns' that RGB LED turn BLUE and will be forgotten
+HIDE_TIME_NS = 20 * 1000 * 1000 * 1000
+### If no advertisement is received for 'stale_time_ns' that RGB LED is flushed for reuse
+STALE_TIME_NS = 200 * 1000 * 1000 * 1000
+SCAN_TIME_S = 10
+### Time between two refresh of the outputs
+REFRESH_NS = 250 * 1000 * 1000
+### Repeated advertisements of a device during that time only update its RSSI peak
+COALESCE_NS = 1000 * 1000 * 1000
+### A device not seen for that time may have changed its address (see contact_scanner.linker),
+### give it as link_quiet_ns to link the addresses (it is off by default)
+LINK_QUIET_NS = 3 * 1000 * 1000 * 1000
+### Weight of a new RSSI in the moving average of a device: 1/2**SMOOTH_SHIFT
+SMOOTH_SHIFT = 2
+
+
+class Scanner:
+    """Scan for Exposure Notification and keep the outputs up to date.
+
+    rows is the number of LED (or key, square, ...) of the outputs, each
+    device get one of them. tracked is the number of devices kept in the
+    table (rows by default).
+
+    on_advert(scanner, row, entry, now_ns) is called for every Exposure
+    Notification advertisement and on_loop(scanner, now_ns) after every
+    advertisement, for the scanners that need more than the outputs.
+
+    The table is updated at most once per coalesce_ns for each device (see
+    contact_scanner.coalesce, 0 to update it on every advertisement), and
+    it is maintained (hide, forget) just before each refresh, so the work
+    follow the number of devices and not the number of advertisements.
+    With link_quiet_ns (LINK_QUIET_NS, 0 by default to keep them apart) a
+    device quiet for that time is linked to the device that appeared when
+    it went quiet (a phone changing its random address), that take its
+    output index. It is a guess, often wrong when people come and go.
+    The RSSI kept for each device is a moving average of the RSSI given to
+    the table (with the coalescing, the highest of each window), see
+    contact_scanner.smooth (smooth_shift=None to keep the last RSSI), give
+    the colour thresholds as rssi_bands to add hysteresis around them.
+    stats (a LoopStats) measure the memory and time taken by each step.
+    distinct (a DistinctCounter) count the different addresses seen in the
+    last minutes, any output or script can read it from scanner.distinct.
+    log (a FlashLog) record every advertisement that update the table, its
+    pages are written to flash at the refresh.
+
+    With a schedule (a ScanSchedule) the interval, window and timeout of
+    each scan follow the crowd density instead of scanning all the time.
+    The outputs are also refreshed at the end of each scan, and a scan
+    never last more than a quarter of hide_time_ns, so the devices are
+    still hidden and forgotten on time when few advertisements are
+    received.
+    """
+
+    def __init__(self, rows, outputs, *, adapter=None,
+                 hide_time_ns=HIDE_TIME_NS, stale_time_ns=STALE_TIME_NS,
+                 scan_time_s=SCAN_TIME_S, refresh_ns=REFRESH_NS, coalesce_ns=COALESCE_NS,
+                 link_quiet_ns=0, smooth_shift=SMOOTH_SHIFT, rssi_bands=(),
+                 tracked=None, names=False, clock=time.monotonic_ns,
+                 on_advert=None, on_loop=None, stats=None, schedule=None,
+                 distinct=None, log=None):
+        if adapter is None:
+            import _bleio
+            adapter = _bleio.adapter
+        self.adapter = adapter
+        self.rows = rows
+        self.outputs = outputs
+        self.hide_time_ns = hide_time_ns
+        self.stale_time_ns = stale_time_ns
+        self.scan_time_s = scan_time_s
+        self.refresh_ns = refresh_ns
+        self.clock = clock
+        self.on_advert = on_advert
+        self.on_loop = on_loop
+        self.stats = stats
+        self.schedule = schedule
+        self.distinct = distinct
+        self.log = log
+        ### Exposure Notification advertisements received
+        self.adverts = 0
+        self.tracked = rows if tracked is None else tracked
+        self.devices = DeviceTable(self.tracked, names=names, slots=rows)
+        self.coalescer = Coalescer(self.tracked, coalesce_ns) if coalesce_ns else None
+        self.linker = RotationLinker(self.tracked, quiet_ns=link_quiet_ns) if link_quiet_ns else None
+        self.rssi_filter = None
+        if smooth_shift is not None:
+            self.rssi_filter = RssiFilter(self.tracked, rssi_bands, shift=smooth_shift)
+        self.last_refresh_ns = None
+
+    def process(self, entry, now_ns):
+        """Record a scan entry if it is Exposure Notification, return its row (or None)."""
+        if not is_exposure_notification(entry.advertisement_bytes):
+            return None
+        return self.record(entry, now_ns)
+
+    def record(self, entry, now_ns):
+        """Record an Exposure Notification scan entry in the table, return its row."""
+        self.adverts += 1
+        key = entry.address.address_bytes
+        if self.schedule is not None:
+            self.schedule.seen(key)
+        if self.distinct is not None:
+            self.distinct.add(key, now_ns)
+        devices = self.devices
+        created = devices.created
+        ### Update in place (or create) the row of that address (no text formatting)
+        if self.coalescer is None:
+            row = devices.update(key, now_ns, entry.rssi)
+            forwarded = True
+        else:
+            row, forwarded = self.coalescer.update(devices, key, now_ns, entry.rssi)
+        if self.log is not None and forwarded:
+            self.log.add(key, entry.rssi, now_ns, devices.created != created)
+        if self.linker is not None and devices.created != created:
+            ### The linker compare the raw RSSI of the first advertisement
+            self.linker.born(devices, row, entry.advertisement_bytes)
+        if self.rssi_filter is not None and forwarded:
+            ### The average follow what the table is given (the peak of a coalesced burst)
+            devices.rssi[row] = self.rssi_filter.update(row, devices.rssi[row],
+                                                        devices.created != created)
+        if self.on_advert is not None:
+            self.on_advert(self, row, entry, now_ns)
+        return row
+
+    def maintain(self, now_ns):
+        """Hide and forget the devices not seen for too long."""
+        devices = self.devices
+        devices.delete_very_old(self.tracked)
+        if self.linker is not None:
+            self.linker.link(devices, now_ns)
+        devices.hide_old(now_ns - self.hide_time_ns)
+        devices.remove_old(now_ns - self.stale_time_ns)
+        if self.distinct is not None:
+            ### The new slices are started here, not by the first advertisement
+            self.distinct.advance(now_ns)
+
+    def refresh(self, now_ns, force=False):
+        """Maintain the table and render all the outputs, if it is time (or forced)."""
+        if (not force and self.last_refresh_ns is not None
+                and now_ns - self.last_refresh_ns < self.refresh_ns):
+            return False
+        self.maintain(now_ns)
+        for output in self.outputs:
+            output.render(self, now_ns)
+        if self.log is not None:
+            ### At most one page, the flash write time stay bounded
+            self.log.flush_page()
+        self.last_refresh_ns = now_ns
+        return True
+
+    def step(self, entry):
+        """Everything done for one scan entry."""
+        now_ns = self.clock()
+        stats = self.stats
+        if stats is not None:
+            stats.loop_start()
+        self.process(entry, now_ns)
+        if stats is not None:
+            stats.advert_done()
+        if self.refresh(now_ns) and stats is not None:
+            stats.refresh_done()
+        for output in self.outputs:
+            output.tick(self, now_ns)
+        ### on_loop is not counted (it may wait for a button to be released)
+        if stats is not None:
+            stats.loop_done()
+        if self.on_loop is not None:
+            self.on_loop(self, now_ns)
+
+    def scan(self):
+        """One scan window of scan_time_s (or as decided by the schedule)."""
+        schedule = self.schedule
+        if schedule is None:
+            for entry in self.adapter.start_scan(minimum_rssi=-127, timeout=self.scan_time_s):
+                self.step(entry)
+            return
+
+        start_ns = self.clock()
+        adverts = self.adverts
+        timeout_s = min(schedule.timeout_s, self.hide_time_ns / 4000000000)
+        for entry in self.adapter.start_scan(minimum_rssi=-127, timeout=timeout_s,
+                                             interval=schedule.interval_s,
+                                             window=schedule.window_s):
+            self.step(entry)
+        now_ns = self.clock()
+        ### There may have been no advertisement for a while at low duty
+        self.refresh(now_ns, force=True)
+        schedule.update(now_ns - start_ns, self.adverts - adverts)
+
+    def run(self):
+        """Scan forever."""
+        while True:
+            self.scan()
@@ -0,0 +1,213 @@
+### CoronAlert Scanner ring buffer log on flash
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Log the devices seen to a file of fixed size, the oldest records are
+overwritten when it is full (the flash never fill up).
+
+The file is made once with its final size. The first page is the header
+(HEADER: magic, version, record size, page size, number of records, write
+cursor, wrapped flag and number of sessions), the records start at the
+second page. Each record is RECORD: time in ms since the start of the
+session, address id (the first two bytes of the address, the address
+itself is not kept), RSSI and event (EVENT_*).
+
+The records are staged in a RAM buffer of a few pages. A page is only
+written once full, at most one page at each refresh of the Scanner, and
+the header (write cursor) after it: the worst flush is one page and one
+header write, whatever the number of devices. If the buffer is full
+before a refresh, the oldest page is written at once.
+
+On the board the CIRCUITPY drive must be writable by CircuitPython (see
+capture_recorder.py). On a computer read_log() give the records back in
+order, see tools/dump_log.py.
+"""
+
+import struct
+import time
+
+MAGIC = b"ENLG"
+VERSION = 1
+### magic, version, record size, page size, records, cursor, wrapped, sessions
+HEADER = "<4sBBHIIBH"
+### t_ms since the start of the session, address id, RSSI, event
+RECORD = "<IHbB"
+RECORD_SIZE = struct.calcsize(RECORD)
+PAGE_SIZE = 512
+
+### Event 0 is never written, an empty record is all zero
+EVENT_START = 1   ### start of a session, the address id is the session number
+EVENT_NEW = 2     ### first advertisement of an address
+EVENT_SEEN = 3    ### advertisement of a known address (at most once per coalesce_ns)
+
+
+def address_id(key):
+    """The id of an address in the log: its first two bytes."""
+    return key[0] | key[1] << 8
+
+
+class FlashLog:
+    """Ring buffer of fixed size records in the file path.
+
+    The file is created (or made again if its size or format changed) with
+    size bytes, rounded down to whole pages. staged_pages of RAM keep the
+    records not written yet.
+    """
+
+    def __init__(self, path, size=64 * 1024, *, staged_pages=2, page_size=PAGE_SIZE,
+                 clock=time.monotonic_ns):
+        self.page_size = page_size
+        self.page_records = page_size // RECORD_SIZE
+        self.capacity = (size // page_size - 1) * self.page_records
+        if self.capacity <= 0:
+            raise ValueError("log smaller than two pages")
+        self.clock = clock
+        self.stream = self._open(path, size)
+        self._buffer = bytearray(staged_pages * page_size)
+        self._view = memoryview(self._buffer)
+        ### Records in the buffer, from the start of the page at _page_record
+        self._staged = 0
+        self._page_record = self.cursor - self.cursor % self.page_records
+        ### The records of the partly written page are read back into the buffer
+        if self._page_record != self.cursor:
+            self.stream.seek(self._offset(self._page_record))
+            self._staged = self.cursor - self._page_record
+            self.stream.readinto(self._view[:self._staged * RECORD_SIZE])
+        self.records = 0
+        self.pages = 0
+        self.flush_ns = 0
+        self.max_flush_ns = 0
+        self.sessions += 1
+        self._start_ns = 0
+        self.add_event(EVENT_START, self.sessions & 0xFFFF, 0, 0)
+        ### The time of the session start with its first advertisement
+        self._start_ns = None
+
+    def _open(self, path, size):
+        try:
+            stream = open(path, "r+b")
+        except OSError:
+            stream = None
+        if stream is not None:
+            header = stream.read(struct.calcsize(HEADER))
+            magic = None
+            if len(header) == struct.calcsize(HEADER):
+                (magic, version, record_size, page_size,
+                 capacity, cursor, wrapped, sessions) = struct.unpack(HEADER, header)
+            if (magic == MAGIC and version == VERSION and record_size == RECORD_SIZE
+                    and page_size == self.page_size and capacity == self.capacity
+                    and cursor < capacity):
+                self.cursor = cursor
+                self.wrapped = wrapped
+                self.sessions = sessions
+                return stream
+            stream.close()
+        ### Make the file with its final size, one page at a time
+        self.cursor = 0
+        self.wrapped = 0
+        self.sessions = 0
+        stream = open(path, "wb")
+        page = bytes(self.page_size)
+        for _ in range(self.capacity // self.page_records + 1):
+            stream.write(page)
+        stream.close()
+        stream = open(path, "r+b")
+        self._write_header(stream)
+        return stream
+
+    def _write_header(self, stream):
+        stream.seek(0)
+        stream.write(struct.pack(HEADER, MAGIC, VERSION, RECORD_SIZE, self.page_size,
+                                 self.capacity, self.cursor, self.wrapped, self.sessions))
+
+    def _offset(self, record):
+        return self.page_size + record * RECORD_SIZE
+
+    def add_event(self, event, addr_id, rssi, now_ns):
+        """Stage one record."""
+        if self._start_ns is None:
+            self._start_ns = now_ns
+        if self._staged * RECORD_SIZE == len(self._buffer):
+            ### No refresh came in time, the scan loop has to wait for one page
+            self.flush_page()
+        struct.pack_into(RECORD, self._buffer, self._staged * RECORD_SIZE,
+                         (now_ns - self._start_ns) // 1000000, addr_id, rssi, event)
+        self._staged += 1
+        self.records += 1
+
+    def add(self, key, rssi, now_ns, new=False):
+        """Stage the record of an advertisement of the address key."""
+        self.add_event(EVENT_NEW if new else EVENT_SEEN, address_id(key), rssi, now_ns)
+
+    def flush_page(self):
+        """Write the oldest page of the buffer if it is full, return True if written."""
+        page_records = self.page_records
+        if self._staged < page_records:
+            return False
+        start_ns = self.clock()
+        self._write(page_records)
+        ### The next page move to the start of the buffer
+        page_size = self.page_size
+        self._staged -= page_records
+        used = self._staged * RECORD_SIZE
+        self._view[:used] = self._view[page_size:page_size + used]
+        self._page_record = (self._page_record + page_records) % self.capacity
+        if self._page_record == 0:
+            self.wrapped = 1
+        self.cursor = self._page_record
+        self._write_header(self.stream)
+        self.stream.flush()
+        self.pages += 1
+        flush_ns = self.clock() - start_ns
+        self.flush_ns += flush_ns
+        if flush_ns > self.max_flush_ns:
+            self.max_flush_ns = flush_ns
+        return True
+
+    def _write(self, records):
+        self.stream.seek(self._offset(self._page_record))
+        self.stream.write(self._view[:records * RECORD_SIZE])
+
+    def sync(self):
+        """Write everything staged, the last page is written again once full."""
+        while self.flush_page():
+            pass
+        if self._staged:
+            self._write(self._staged)
+            self.cursor = self._page_record + self._staged
+            self._write_header(self.stream)
+        self.stream.flush()
+
+    def close(self):
+        """Write everything staged and close the file."""
+        self.sync()
+        self.stream.close()
+
+
+def read_log(stream):
+    """Yield (session, t_ms, address id, RSSI, event) of every record, oldest first.
+
+    session is None for the records older than the first session start
+    still in the log (their start was overwritten).
+    """
+    header_size = struct.calcsize(HEADER)
+    (magic, version, record_size, page_size,
+     capacity, cursor, wrapped, sessions) = struct.unpack(HEADER, stream.read(header_size))
+    if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+        raise ValueError("not a log file")
+    if wrapped:
+        ranges = ((cursor, capacity), (0, cursor))
+    else:
+        ranges = ((0, cursor),)
+    session = None
+    for first, last in ranges:
+        stream.seek(page_size + first * RECORD_SIZE)
+        data = stream.read((last - first) * RECORD_SIZE)
+        for t_ms, addr_id, rssi, event in struct.iter_unpack(RECORD, data):
+            if event == 0:
+                continue
+            if event == EVENT_START:
+                session = addr_id
+            yield session, t_ms, addr_id, rssi, event
@@ -0,0 +1,129 @@
+### CoronAlert Scanner rotation linker
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Follow a phone when it change its random address.
+
+Every 10-15 minutes a phone change its address (and its Rolling Proximity
+Identifier), the old address is never seen again and a new one appear.
+Without linking, the old LED turn blue and a new one light up, so a crowd
+of 10 phones look like 20 over time.
+
+The devices that appeared recently are kept in a small ring, ordered by
+time of appearance. When a device goes quiet (not seen for quiet_ns, found
+with DeviceTable.next_quiet()), the devices that appeared just around its
+last advertisement are the only candidates: the one with the closest RSSI
+(and a different Exposure Notification payload) is the same phone with its
+new address. It takes the LED of the old address, and the old address is
+forgotten at once instead of staying blue until it is stale.
+"""
+
+import array
+
+from contact_scanner.table import NIL
+from contact_scanner.advertising import en_payload
+
+### Ring entry of a device already linked
+_LINKED = -2
+
+
+class RotationLinker:
+    """Link the devices that went quiet to the devices that appeared at that time.
+
+    A candidate must have appeared between before_ns before and after_ns
+    after the last advertisement of the quiet device, with a first RSSI
+    at most max_rssi_step dB away from its last RSSI. A device last seen
+    below min_rssi is not linked: at the edge of the range a phone leaving
+    and a phone arriving look the same.
+    """
+
+    def __init__(self, capacity, *, quiet_ns=3 * 1000 * 1000 * 1000,
+                 before_ns=250 * 1000 * 1000, after_ns=2 * 1000 * 1000 * 1000,
+                 max_rssi_step=6, min_rssi=-80, ring_size=16):
+        self.quiet_ns = quiet_ns
+        self.before_ms = before_ns // 1000000
+        self.after_ms = after_ns // 1000000
+        self.max_rssi_step = max_rssi_step
+        self.min_rssi = min_rssi
+        ### Per row: time of appearance, first RSSI and start of the payload
+        self.born_ms = array.array("L", [0] * capacity)
+        self.first_rssi = array.array("b", [0] * capacity)
+        self.tag = array.array("H", [0] * capacity)
+        ### The last devices that appeared, oldest first from _ring_pos
+        self._ring_row = array.array("h", [NIL] * ring_size)
+        self._ring_ms = array.array("L", [0] * ring_size)
+        self._ring_pos = 0
+        self.links = 0
+
+    def born(self, table, row, adv):
+        """A new device appeared in row, with the advertisement adv."""
+        now_ms = table.last_ms[row]
+        self.born_ms[row] = now_ms
+        self.first_rssi[row] = table.rssi[row]
+        payload = en_payload(adv)
+        self.tag[row] = (payload[0] << 8 | payload[1]) if payload is not None else 0
+        pos = self._ring_pos
+        self._ring_row[pos] = row
+        self._ring_ms[pos] = now_ms
+        self._ring_pos = (pos + 1) % len(self._ring_row)
+
+    def _candidate(self, table, old_row):
+        """Return the ring position of the best new device for old_row, or NIL."""
+        gone_ms = table.last_ms[old_row]
+        rssi = table.rssi[old_row]
+        if rssi < self.min_rssi:
+            return NIL
+        tag = self.tag[old_row]
+        best = NIL
+        best_step = self.max_rssi_step + 1
+        size = len(self._ring_row)
+        ### Walk back from the newest, stop at the first one too old
+        pos = self._ring_pos
+        for _ in range(size):
+            pos = (pos - 1) % size
+            row = self._ring_row[pos]
+            if row == NIL:
+                break
+            born_ms = self._ring_ms[pos]
+            if born_ms + self.before_ms < gone_ms:
+                break
+            if row == _LINKED:
+                continue
+            if (born_ms > gone_ms + self.after_ms
+                    or row == old_row
+                    or not table.used(row)
+                    or self.born_ms[row] != born_ms
+                    or born_ms < self.born_ms[old_row]):
+                continue
+            if tag and tag == self.tag[row]:
+                ### Same identifier, not a new one
+                continue
+            step = abs(self.first_rssi[row] - rssi)
+            if step < best_step:
+                best = pos
+                best_step = step
+        return best
+
+    def link(self, table, now_ns):
+        """Link the devices gone quiet since the last call, return the number linked."""
+        linked = 0
+        quiet_time_ns = now_ns - self.quiet_ns
+        while True:
+            old_row = table.next_quiet(quiet_time_ns)
+            if old_row == NIL:
+                break
+            pos = self._candidate(table, old_row)
+            if pos == NIL:
+                continue
+            new_row = self._ring_row[pos]
+            ### A new device is only linked once
+            self._ring_row[pos] = _LINKED
+            table.move_index(old_row, new_row)
+            if table.names is not None and table.names[new_row] is None:
+                table.names[new_row] = table.names[old_row]
+            table.release(old_row)
+            linked += 1
+        self.links += linked
+        return linked
@@ -0,0 +1,124 @@
+### CoronAlert Scanner NeoTrellis pixels in bulk
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Write the pixels of a NeoTrellis in a few bulk transfers per frame.
+
+The NeoPixel of adafruit_seesaw send one I2C transaction for each pixel
+set (even with auto_write=False, only show() is delayed), so a frame with
+all the keys changed is 16 transactions of 7 bytes, plus the show. Here
+the colours are kept in a local buffer, already in the order of the seesaw
+(GRB), and show() send the pixels changed as ranges: one NEOPIXEL_BUF
+write (2 bytes of register, 2 bytes of offset, then the colours) per range
+of at most max_bytes, a small gap of unchanged pixels being sent with the
+range instead of starting a new transaction, then one NEOPIXEL_SHOW.
+
+The transfer use a preallocated buffer and the i2c_device of the seesaw
+(the NeoTrellis itself), nothing is allocated per frame. The NeoTrellis
+must have set up its pixels (pin and buffer length) as it does at init.
+"""
+
+from contact_scanner.pixels import FrameBuffer
+
+_NEOPIXEL_BASE = 0x0E
+_NEOPIXEL_BUF = 0x04
+_NEOPIXEL_SHOW = 0x05
+
+### Seesaw pixel order (index of red, green and blue in a pixel)
+GRB = (1, 0, 2)
+RGB = (0, 1, 2)
+
+
+class TrellisBuffer(FrameBuffer):
+    """Dirty tracked pixels of a seesaw (NeoTrellis), sent in bulk at show().
+
+    max_bytes is the colour bytes of one transaction (the seesaw take 32
+    bytes at most with the header). A gap of up to max_gap unchanged pixels
+    is sent inside a range, it cost less than the 5 bytes of a new one.
+
+    Metrics (as FrameBuffer, and): transactions, bytes (since the start),
+    frame_transactions, frame_bytes (the last frame)
+    """
+
+    def __init__(self, seesaw, n, *, order=GRB, brightness=1.0, bpp=3,
+                 max_bytes=24, max_gap=1, min_interval_ns=0):
+        super().__init__(seesaw, n, min_interval_ns=min_interval_ns)
+        self.i2c_device = seesaw.i2c_device
+        self.order = order
+        self.brightness = brightness
+        self.bpp = bpp
+        self.max_bytes = max_bytes - max_bytes % bpp
+        self.max_gap = max_gap
+        self._colors = bytearray(n * bpp)
+        self._dirty = bytearray(n)
+        self._out = bytearray(4 + self.max_bytes)
+        self._show_cmd = bytes((_NEOPIXEL_BASE, _NEOPIXEL_SHOW))
+        self.transactions = 0
+        self.bytes = 0
+        self.frame_transactions = 0
+        self.frame_bytes = 0
+
+    def _write(self, index, packed):
+        start = index * self.bpp
+        order = self.order
+        colors = self._colors
+        if self.brightness == 1.0:
+            colors[start + order[0]] = (packed >> 16) & 0xFF
+            colors[start + order[1]] = (packed >> 8) & 0xFF
+            colors[start + order[2]] = packed & 0xFF
+        else:
+            brightness = self.brightness
+            colors[start + order[0]] = int(((packed >> 16) & 0xFF) * brightness)
+            colors[start + order[1]] = int(((packed >> 8) & 0xFF) * brightness)
+            colors[start + order[2]] = int((packed & 0xFF) * brightness)
+        self._dirty[index] = 1
+
+    def _send(self, i2c, first, last):
+        """Send the pixels first to last (included) in transactions of max_bytes."""
+        bpp = self.bpp
+        out = self._out
+        colors = self._colors
+        start = first * bpp
+        end = (last + 1) * bpp
+        while start < end:
+            size = min(end - start, self.max_bytes)
+            out[0] = _NEOPIXEL_BASE
+            out[1] = _NEOPIXEL_BUF
+            out[2] = start >> 8
+            out[3] = start & 0xFF
+            ### Byte by byte, a slice would allocate
+            for offset in range(size):
+                out[4 + offset] = colors[start + offset]
+            i2c.write(out, end=4 + size)
+            self.frame_transactions += 1
+            self.frame_bytes += 4 + size
+            start += size
+
+    def _show(self):
+        dirty = self._dirty
+        max_gap = self.max_gap
+        self.frame_transactions = 0
+        self.frame_bytes = 0
+        with self.i2c_device as i2c:
+            first = -1
+            last = -1
+            for index in range(self.n):
+                if not dirty[index]:
+                    continue
+                dirty[index] = 0
+                if first < 0:
+                    first = index
+                elif index - last - 1 > max_gap:
+                    ### Too many unchanged pixels, end the range
+                    self._send(i2c, first, last)
+                    first = index
+                last = index
+            if first >= 0:
+                self._send(i2c, first, last)
+            i2c.write(self._show_cmd)
+        self.frame_transactions += 1
+        self.frame_bytes += 2
+        self.transactions += self.frame_transactions
+        self.bytes += self.frame_bytes
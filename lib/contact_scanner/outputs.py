@@ -0,0 +1,213 @@
+### CoronAlert Scanner outputs
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+The ways of showing the devices found by the Scanner.
+
+Every output has the same two methods called by the Scanner:
+ * render(scanner, now_ns) at each refresh
+ * tick(scanner, now_ns) after every advertisement (for the animations),
+   it can return the time it needs the next tick (the Runtime sleep until
+   then)
+
+The colour outputs (NeoPixel, DotStar, NeoTrellis, CLUE patchwork) show
+each device on its own index, with the colour of a ColorTable.
+"""
+
+from contact_scanner.table import NIL
+from contact_scanner.pixels import FrameBuffer, PaletteBuffer
+from contact_scanner.neotrellis import TrellisBuffer
+from contact_scanner.blink import BlinkPattern
+
+
+class Output:
+    """Base of the outputs, doing nothing."""
+
+    def render(self, scanner, now_ns):
+        """Show the state of the scanner."""
+        pass
+
+    def tick(self, scanner, now_ns):
+        """Called after every advertisement, return the time of the next tick needed (or None)."""
+        return None
+
+
+class SlotOutput(Output):
+    """Output with one colour per device index (n must not be above the rows of the scanner)."""
+
+    def __init__(self, n, colors):
+        self.n = n
+        self.colors = colors
+
+    def render(self, scanner, now_ns):
+        table = scanner.devices
+        colors = self.colors
+        ### Each index (LED) is owned by at most one row, no sorting needed
+        for index in range(self.n):
+            row = table.row_by_index[index]
+            if row == NIL:
+                ### Unused index, clear the color
+                pixel_color = 0x000000
+            else:
+                pixel_color = colors.color(table.age_ms(row, now_ns), table.rssi[row])
+            self.set_color(index, pixel_color)
+        self.show(now_ns)
+
+    def set_color(self, index, color):
+        """Set the packed colour of one index."""
+        raise NotImplementedError()
+
+    def show(self, now_ns):
+        """End of a frame."""
+        pass
+
+
+class PixelOutput(SlotOutput):
+    """NeoPixel or DotStar strip (auto_write is turned off)."""
+
+    def __init__(self, pixels, n, colors, *, min_interval_ns=0):
+        super().__init__(n, colors)
+        pixels.auto_write = False
+        ### Only the LED that change are written, with one show() per frame
+        self.frame = FrameBuffer(pixels, n, min_interval_ns=min_interval_ns)
+
+    def set_color(self, index, color):
+        self.frame[index] = color
+
+    def show(self, now_ns):
+        self.frame.show(now_ns)
+
+
+class TrellisOutput(PixelOutput):
+    """The keys of a NeoTrellis, sent in a few bulk transfers per frame (see TrellisBuffer).
+
+    With bulk=False each key changed is written by trellis.pixels (one I2C
+    transaction per key).
+    """
+
+    def __init__(self, trellis, n, colors, *, min_interval_ns=0, bulk=True):
+        if not bulk:
+            super().__init__(trellis.pixels, n, colors, min_interval_ns=min_interval_ns)
+            return
+        SlotOutput.__init__(self, n, colors)
+        self.frame = TrellisBuffer(trellis, n, brightness=getattr(trellis.pixels, "brightness", 1.0),
+                                   min_interval_ns=min_interval_ns)
+
+
+class PatchworkOutput(SlotOutput):
+    """The squares of the CLUE patchwork, one palette entry per square from 'first'.
+
+    Only the entries that changed are written (see PaletteBuffer, 'frame'
+    give the entries written and the time of the last frame). With a layout
+    (a PatchworkLayout) the grid follow the highest index used.
+    """
+
+    def __init__(self, palette, n, colors, *, first=2, layout=None):
+        super().__init__(n, colors)
+        self.palette = palette
+        self.first = first
+        self.layout = layout
+        self.frame = PaletteBuffer(palette, n, first=first)
+
+    def render(self, scanner, now_ns):
+        super().render(scanner, now_ns)
+        if self.layout is not None:
+            row_by_index = scanner.devices.row_by_index
+            used = self.n
+            while used > 0 and row_by_index[used - 1] == NIL:
+                used -= 1
+            self.layout.fit(used, now_ns)
+
+    def set_color(self, index, color):
+        self.frame[index] = color
+
+    def show(self, now_ns):
+        self.frame.show(now_ns)
+
+
+class LabelOutput(Output):
+    """Text rows (name, MAC and RSSI) of the devices with the highest RSSI, recently seen.
+
+    The text colour is used to indicate how recent. data_mask hide part
+    (1) or all (2) of the MAC address. summary(scanner) give the text of
+    summary_label.
+    """
+
+    MASK_LEVELS = 3
+
+    def __init__(self, labels, rows_n, stale_time_ns, *, summary_label=None, summary=None):
+        self.labels = labels
+        self.rows_n = rows_n
+        self.stale_time_ns = stale_time_ns
+        self.summary_label = summary_label
+        self.summary = summary
+        self.data_mask = 0
+
+    def render(self, scanner, now_ns):
+        if self.summary_label is not None and self.summary is not None:
+            self.summary_label.text = self.summary(scanner)
+
+        table = scanner.devices
+        ### Sort by the RSSI field, then the time field
+        sorted_rows = sorted([row for row in range(table.capacity) if table.used(row)],
+                             key=lambda row: (table.rssi[row], table.last_ms[row]),
+                             reverse=True)
+
+        ### Add the top N rows to to the screen
+        ### the text of the mac address is only made for the rows displayed (and kept by the table)
+        idx = 0
+        for row in sorted_rows[:self.rows_n]:
+            rssi = table.rssi[row]
+            if self.data_mask == 0:
+                mac_text = table.mac_text(row)
+            elif self.data_mask == 1:
+                mac_text = table.mac_text(row)[0:8] + ":--:--:--"
+            else:
+                mac_text = "--:--:--:--:--:--"
+            name = table.names[row] if table.names is not None else None
+            if name is None:
+                name = "?"
+            ### Must be careful not to exceed the fixed max_glyphs field size here (40)
+            self.labels[idx].text = "{:16s} {:s} {:4d}".format(name[:16],
+                                                               mac_text,  ### should be 17 chars
+                                                               rssi)
+            ### This should be from 0 to about 65s-75s
+            age = 170 - table.age_ms(row, now_ns) * 1000000 / self.stale_time_ns * 170
+            brightness = min(max(round(85 + age * 2.4), 0), 255)
+            self.labels[idx].color = (brightness, brightness, 0)
+            idx += 1
+
+        #### Blank out any rows not populated with data
+        while idx < self.rows_n:
+            self.labels[idx].text = ""
+            idx += 1
+
+    def next_mask(self):
+        """Hide more (or less) of the MAC address."""
+        self.data_mask = (self.data_mask + 1) % self.MASK_LEVELS
+
+
+class BlinkOutput(Output):
+    """Blink a LED as many times as devices advertised recently, then pause.
+
+    The blinks follow their own time line (see contact_scanner.blink), the
+    count is only given to the pattern at each refresh.
+    """
+
+    def __init__(self, led, *, active_ns=10 * 1000 * 1000 * 1000,
+                 on_ns=200 * 1000 * 1000, off_ns=200 * 1000 * 1000,
+                 pause_ns=5 * 1000 * 1000 * 1000):
+        self.active_ns = active_ns
+        self.pattern = BlinkPattern(led, on_ns=on_ns, off_ns=off_ns, pause_ns=pause_ns)
+        ### Number of blink
+        self.count = 0
+
+    def render(self, scanner, now_ns):
+        ### This will be the number of blink
+        self.count = scanner.devices.count_recent(now_ns - self.active_ns)
+        self.pattern.set_count(self.count)
+
+    def tick(self, scanner, now_ns):
+        return self.pattern.update(now_ns)
@@ -0,0 +1,136 @@
+### CoronAlert Scanner CLUE patchwork layouts
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+The grids of squares of the CLUE patchwork, built once and swapped.
+
+Each level is a square bitmap of SIDES[level] squares per side, scaled by
+SCALES[level] to fill the 240x240 screen, every square having its own
+palette entry (from 2, 0 and 1 are reserved). The squares are numbered
+in growing shells from the top left corner (fill_bitmap), so the square
+of an index is at the same place in every level, and a smaller level only
+lose the last squares.
+
+A level is built the first time it is needed (or all of them at boot with
+prebuild()), then kept: all the levels together are about 1KB of bitmaps.
+Changing level only hide one group and show another, nothing is allocated.
+The grid grow at once when a square is missing, and shrink only when the
+squares fit in a smaller level (with 'margin' squares to spare) for
+hold_ns, so it does not jump up and down when a device come and go.
+"""
+
+SIDES = (1, 2, 3, 4, 5, 6, 8, 10, 12, 15)
+SCALES = (240, 120, 80, 60, 48, 40, 30, 24, 20, 16)
+
+
+def fill_bitmap(bitmap, first=2):
+    """Number the squares of a square bitmap in growing shells, from first."""
+    value = first
+    for limit in range(bitmap.width):
+        if limit % 2 == 0:
+            for i in range(limit):
+                bitmap[i, limit] = value
+                value += 1
+            for j in range(limit, -1, -1):
+                bitmap[limit, j] = value
+                value += 1
+        else:
+            for i in range(limit):
+                bitmap[limit, i] = value
+                value += 1
+            for j in range(limit, -1, -1):
+                bitmap[j, limit] = value
+                value += 1
+
+
+class PatchworkLayout:
+    """The levels of the patchwork in parent, showing palette.
+
+    displayio is the module making the bitmaps and groups (the one of the
+    board by default, the host tools give a stub).
+    """
+
+    def __init__(self, parent, palette, *, sides=SIDES, scales=SCALES, margin=2,
+                 hold_ns=10 * 1000 * 1000 * 1000, displayio=None):
+        if displayio is None:
+            import displayio
+        self.displayio = displayio
+        self.parent = parent
+        self.palette = palette
+        self.sides = sides
+        self.scales = scales
+        self.margin = margin
+        self.hold_ns = hold_ns
+        self._groups = [None] * len(sides)
+        self.level = None
+        ### Since when the squares fit in a smaller level
+        self._small_since_ns = None
+        self.builds = 0
+        self.changes = 0
+
+    def capacity(self, level):
+        """Number of squares of a level."""
+        return self.sides[level] * self.sides[level]
+
+    def level_for(self, count):
+        """The smallest level with count squares (the biggest if none)."""
+        for level in range(len(self.sides)):
+            if self.capacity(level) >= count:
+                return level
+        return len(self.sides) - 1
+
+    def _group(self, level):
+        group = self._groups[level]
+        if group is None:
+            displayio = self.displayio
+            side = self.sides[level]
+            bitmap = displayio.Bitmap(side, side, side * side + 2)
+            fill_bitmap(bitmap)
+            group = displayio.Group(scale=self.scales[level])
+            group.append(displayio.TileGrid(bitmap, pixel_shader=self.palette))
+            group.hidden = True
+            self.parent.append(group)
+            self._groups[level] = group
+            self.builds += 1
+        return group
+
+    def prebuild(self, last=None):
+        """Build the levels up to last (all of them) now, not when they are first needed."""
+        if last is None:
+            last = len(self.sides) - 1
+        for level in range(last + 1):
+            self._group(level)
+
+    def show(self, level):
+        """Show a level, hide the one shown."""
+        if level == self.level:
+            return
+        group = self._group(level)
+        if self.level is not None:
+            self._groups[self.level].hidden = True
+        group.hidden = False
+        self.level = level
+        self.changes += 1
+
+    def fit(self, count, now_ns):
+        """Show the level for count squares, return True if it changed."""
+        needed = self.level_for(count)
+        if self.level is None or needed > self.level:
+            ### Grow at once, a square is missing
+            self._small_since_ns = None
+            self.show(needed)
+            return True
+        smaller = self.level_for(count + self.margin)
+        if smaller >= self.level:
+            self._small_since_ns = None
+            return False
+        if self._small_since_ns is None:
+            self._small_since_ns = now_ns
+            return False
+        if now_ns - self._small_since_ns < self.hold_ns:
+            return False
+        self._small_since_ns = None
+        self.show(smaller)
+        return True
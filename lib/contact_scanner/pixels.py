@@ -0,0 +1,108 @@
+### CoronAlert Scanner pixel output buffering
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Only send the pixels that changed, and only one show() per frame.
+
+The NeoPixel, DotStar or NeoTrellis pixels must be created with
+auto_write=False (or have it set to False), the FrameBuffer remember the
+colour last sent to each index and skip the pixels that did not change.
+There is no sleep: if an output can not be refreshed too often, give a
+min_interval_ns and show() will simply keep the changes for a later frame.
+
+PaletteBuffer do the same for the entries of a displayio Palette (the
+squares of the CLUE patchwork).
+"""
+
+import array
+import time
+
+### Colour never sent to a pixel, so the first frame write them all
+_UNKNOWN = -1
+
+
+def pack_color(color):
+    """Return a (r, g, b) tuple as a 0xRRGGBB int (int are returned as is)."""
+    if isinstance(color, int):
+        return color
+    return (color[0] << 16) | (color[1] << 8) | color[2]
+
+
+class FrameBuffer:
+    """Dirty tracked access to the n first pixels of an output.
+
+    Metrics (for the last frame shown and since the start):
+    frame_writes, frame_ns, frames, pixel_writes
+    """
+
+    def __init__(self, pixels, n, *, min_interval_ns=0):
+        self.pixels = pixels
+        self.n = n
+        self.min_interval_ns = min_interval_ns
+        self._sent = array.array("l", [_UNKNOWN] * n)
+        self._pending = 0
+        self._frame_start_ns = 0
+        self._last_show_ns = None
+        ### Metrics
+        self.frames = 0
+        self.pixel_writes = 0
+        self.frame_writes = 0
+        self.frame_ns = 0
+
+    def __setitem__(self, index, color):
+        packed = pack_color(color)
+        if self._sent[index] != packed:
+            if self._pending == 0:
+                self._frame_start_ns = time.monotonic_ns()
+            self._write(index, packed)
+            self._sent[index] = packed
+            self._pending += 1
+
+    def __getitem__(self, index):
+        return self._sent[index]
+
+    def _write(self, index, packed):
+        self.pixels[index] = packed
+
+    def _show(self):
+        self.pixels.show()
+
+    def show(self, now_ns=None):
+        """Show the pending changes, return True if the output was refreshed."""
+        if self._pending == 0:
+            return False
+        if now_ns is not None and self.min_interval_ns:
+            if (self._last_show_ns is not None
+                    and now_ns - self._last_show_ns < self.min_interval_ns):
+                ### Too early for this output, keep the changes for the next frame
+                return False
+            self._last_show_ns = now_ns
+        self._show()
+        self.frames += 1
+        self.pixel_writes += self._pending
+        self.frame_writes = self._pending
+        self.frame_ns = time.monotonic_ns() - self._frame_start_ns
+        self._pending = 0
+        return True
+
+
+class PaletteBuffer(FrameBuffer):
+    """Dirty tracked access to n entries of a displayio Palette, from 'first'.
+
+    Every palette write mark the squares using it for the next refresh of
+    the display, so only the entries that changed are written. There is no
+    show() on a Palette (the display refresh by itself), show() only end the
+    frame and its metrics (frame_writes is the entries written).
+    """
+
+    def __init__(self, palette, n, *, first=2):
+        super().__init__(palette, n)
+        self.first = first
+
+    def _write(self, index, packed):
+        self.pixels[self.first + index] = packed
+
+    def _show(self):
+        pass
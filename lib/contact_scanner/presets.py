@@ -0,0 +1,49 @@
+### CoronAlert Scanner colour presets
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+The default colour thresholds and colours of the scanner scripts.
+
+Each script keep its own RSSI_VALUE, RSSI_COLOR, TIME_BLUE, SHADE_BLUE...
+at the top, to be changed there, and give them to ColorTable. These are
+the values the scripts are shipped with, for the host tools
+(tools/profiles.py build the scanners with them, and check that the
+scripts still have the same values).
+
+SMALL is the dim palette of the LED scripts (cpb_corona.py, SnowPi RGB,
+NeoTrellis, PyPortal), SHOW the bright one of show_and_tell_version.py.
+"""
+
+from contact_scanner.colors import ColorTable
+
+SEC_NS = 1000 * 1000 * 1000
+
+### RSSI thresholds of the colours (and of the hysteresis of the RSSI filter)
+RSSI_VALUE = [-80, -75, -70, -65, -60, -55]
+
+MINI_BLUE = (0, 0, 1)
+RSSI_DEFAULT_COLOR = (63, 0, 0)
+
+SMALL_RSSI_COLOR = [(0, 31, 0), (15, 31, 0), (15, 15, 0), (31, 15, 0), (31, 0, 0), (63, 0, 0)]
+SMALL_SHADE_BLUE = [(0, 0, 63), (0, 0, 31), (0, 0, 15), (0, 0, 7), (0, 0, 3)]
+SMALL_TIME_BLUE = [50 * SEC_NS, 80 * SEC_NS, 110 * SEC_NS, 140 * SEC_NS, 170 * SEC_NS]
+
+SHOW_RSSI_COLOR = [(0, 255, 0), (127, 255, 0), (127, 127, 0), (255, 127, 0), (255, 191, 0), (255, 0, 0)]
+SHOW_SHADE_BLUE = [(0, 0, 255), (0, 0, 127), (0, 0, 63), (0, 0, 31),
+                   (0, 0, 15), (0, 0, 7), (0, 0, 3), (0, 0, 1)]
+SHOW_TIME_BLUE = [40 * SEC_NS, 60 * SEC_NS, 80 * SEC_NS, 100 * SEC_NS,
+                  120 * SEC_NS, 140 * SEC_NS, 160 * SEC_NS, 180 * SEC_NS]
+
+
+def small_colors():
+    """ColorTable of the dim palette."""
+    return ColorTable(RSSI_VALUE, SMALL_RSSI_COLOR, RSSI_DEFAULT_COLOR,
+                      SMALL_TIME_BLUE, SMALL_SHADE_BLUE, MINI_BLUE)
+
+
+def show_colors():
+    """ColorTable of the bright palette."""
+    return ColorTable(RSSI_VALUE, SHOW_RSSI_COLOR, RSSI_DEFAULT_COLOR,
+                      SHOW_TIME_BLUE, SHOW_SHADE_BLUE, MINI_BLUE)
@@ -0,0 +1,341 @@
+### CoronAlert Scanner asyncio runtime
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Run the Scanner as separate asyncio tasks instead of inside the scan loop.
+
+With Scanner.run() everything is done after an advertisement, so an LED
+blinking or a button only move when a phone advertise (nothing move in an
+empty room), and in a crowd the refresh delay the scan. Here each job is
+its own task, with its own pace:
+
+intake    scan in short slices (slice_s), put the Exposure Notification
+          entries in a bounded queue (the newest are dropped when it is
+          full, the other BLE traffic never take a place in it)
+process   take the entries from the queue into the table
+maintain  hide, link and forget the devices every maintain_ns
+render    one task per output, each at its own period (render_ns)
+tick      the animations of the outputs (blinking), at the time they ask
+          for (see Output.tick) or every tick_ns
+input     on_loop of the Scanner (buttons) every input_ns
+
+Each task measure how late it run after the time it was due and how long
+it take (TaskStats), and the time the entries wait in the queue.
+
+No task poll: process wait for an Event set by intake when it put entries
+in the queue, the others sleep (asyncio.sleep) until their next run, so
+the CPU is idle while the radio is off.
+
+A scan slice still block the other tasks while it last: slice_s is the
+worst delay of a blink or a button. With a schedule (ScanSchedule) the
+radio listen for window_s then the tasks run while it is off until the
+next interval_s.
+
+CircuitPython needs the asyncio library (and adafruit_ticks) in lib.
+On a computer, with the ReplayAdapter and follow_clock=True, the tasks
+sleep on the clock of the replay instead of the real time, so a run take
+the time of the computer and not the time of the capture: a sleeping task
+wait for an Event, set by intake when the replay reach its time.
+"""
+
+import asyncio
+
+from contact_scanner.advertising import is_exposure_notification
+
+### Step of the replay clock while the radio is off (follow_clock=True)
+_IDLE_STEP_NS = 10 * 1000 * 1000
+
+
+class TaskStats:
+    """Lateness and duration of the runs of one task."""
+
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.late_ns = 0
+        self.max_late_ns = 0
+        self.run_ns = 0
+        self.max_run_ns = 0
+
+    def record(self, due_ns, start_ns, end_ns):
+        """A run due at due_ns, started at start_ns and ended at end_ns."""
+        late_ns = start_ns - due_ns if start_ns > due_ns else 0
+        run_ns = end_ns - start_ns
+        self.runs += 1
+        self.late_ns += late_ns
+        self.run_ns += run_ns
+        if late_ns > self.max_late_ns:
+            self.max_late_ns = late_ns
+        if run_ns > self.max_run_ns:
+            self.max_run_ns = run_ns
+
+    def text(self):
+        """One line: runs, mean and max lateness, mean and max duration (in ms)."""
+        runs = max(self.runs, 1)
+        return "{:10s} {:6d} late {:6.1f}/{:6.1f}ms run {:6.1f}/{:6.1f}ms".format(
+            self.name, self.runs, self.late_ns / runs / 1e6, self.max_late_ns / 1e6,
+            self.run_ns / runs / 1e6, self.max_run_ns / 1e6)
+
+
+class EntryQueue:
+    """Bounded queue of scan entries, with the time each one was put in it."""
+
+    def __init__(self, size):
+        self._entries = [None] * size
+        self._put_ns = [0] * size
+        self._head = 0
+        self.count = 0
+        self.dropped = 0
+        self.max_count = 0
+
+    def put(self, entry, now_ns):
+        """Add an entry, return False if the queue was full (the entry is dropped)."""
+        size = len(self._entries)
+        if self.count == size:
+            self.dropped += 1
+            return False
+        tail = (self._head + self.count) % size
+        self._entries[tail] = entry
+        self._put_ns[tail] = now_ns
+        self.count += 1
+        if self.count > self.max_count:
+            self.max_count = self.count
+        return True
+
+    def get(self):
+        """Remove the oldest entry, return (entry, time it was put)."""
+        head = self._head
+        entry = self._entries[head]
+        self._entries[head] = None
+        self._head = (head + 1) % len(self._entries)
+        self.count -= 1
+        return entry, self._put_ns[head]
+
+
+class Runtime:
+    """The tasks of one Scanner.
+
+    render_ns is the period of each output (one value for all, or a list
+    with one value per output of the scanner), the refresh_ns of the
+    scanner by default.
+    """
+
+    def __init__(self, scanner, *, queue_size=32, slice_s=0.1, maintain_ns=None,
+                 render_ns=None, tick_ns=100 * 1000 * 1000, input_ns=50 * 1000 * 1000,
+                 follow_clock=False):
+        self.scanner = scanner
+        self.queue = EntryQueue(queue_size)
+        self.slice_s = slice_s
+        refresh_ns = scanner.refresh_ns
+        self.maintain_ns = refresh_ns if maintain_ns is None else maintain_ns
+        if render_ns is None:
+            render_ns = refresh_ns
+        if not isinstance(render_ns, (list, tuple)):
+            render_ns = [render_ns] * len(scanner.outputs)
+        self.render_ns = render_ns
+        self.tick_ns = tick_ns
+        self.input_ns = input_ns
+        self.follow_clock = follow_clock
+        self.running = False
+        self.stats = [TaskStats("intake"), TaskStats("process"), TaskStats("maintain"),
+                      TaskStats("tick"), TaskStats("input")]
+        self.stats.extend(TaskStats("render{}".format(i)) for i in range(len(scanner.outputs)))
+        ### Entries not Exposure Notification, not queued
+        self.others = 0
+        ### Time the entries waited in the queue
+        self.wait = TaskStats("queue")
+        ### Set by intake when there are entries in the queue
+        self._ready = asyncio.Event()
+        ### Tasks sleeping on the replay clock (follow_clock=True): (due_ns, Event)
+        self._sleepers = []
+
+    async def sleep_until(self, due_ns):
+        """Sleep until the clock of the scanner reach due_ns."""
+        clock = self.scanner.clock
+        if not self.follow_clock:
+            delay_ns = due_ns - clock()
+            await asyncio.sleep(delay_ns / 1e9 if delay_ns > 0 else 0)
+            return
+        if not self.running or clock() >= due_ns:
+            ### Already due, only let the other tasks run once
+            await asyncio.sleep(0)
+            return
+        ### The clock move with the replay, intake wake the task when it is due
+        event = asyncio.Event()
+        self._sleepers.append((due_ns, event))
+        await event.wait()
+
+    def _wake(self, all_of_them=False):
+        """Wake the tasks sleeping on the replay clock that are due."""
+        if not self._sleepers:
+            return
+        now_ns = self.scanner.clock()
+        sleeping = []
+        for due_ns, event in self._sleepers:
+            if all_of_them or due_ns <= now_ns:
+                event.set()
+            else:
+                sleeping.append((due_ns, event))
+        self._sleepers = sleeping
+
+    async def _idle(self, due_ns):
+        """Do not scan until due_ns."""
+        if not self.follow_clock:
+            await self.sleep_until(due_ns)
+            return
+        ### The replay skip the entries received meanwhile, in small steps so the
+        ### other tasks run on time
+        clock = self.scanner.clock
+        adapter = self.scanner.adapter
+        while self.running and clock() < due_ns and not getattr(adapter, "done", False):
+            idle_s = min(due_ns - clock(), _IDLE_STEP_NS) / 1000000000
+            for _ in adapter.start_scan(timeout=idle_s, interval=idle_s, window=0):
+                pass
+            self._wake()
+            await asyncio.sleep(0)
+
+    async def _every(self, period_ns, stats, job):
+        """Run job(now_ns) every period_ns until stopped."""
+        clock = self.scanner.clock
+        due_ns = clock()
+        while self.running:
+            start_ns = clock()
+            job(start_ns)
+            stats.record(due_ns, start_ns, clock())
+            due_ns += period_ns
+            if due_ns < start_ns:
+                ### Too late, skip the runs missed
+                due_ns = start_ns + period_ns
+            await self.sleep_until(due_ns)
+
+    async def intake(self):
+        """Scan in slices, put the entries in the queue."""
+        scanner = self.scanner
+        clock = scanner.clock
+        adapter = scanner.adapter
+        queue = self.queue
+        stats = self.stats[0]
+        schedule = scanner.schedule
+        adverts = 0
+        scan_start_ns = clock()
+        while self.running:
+            start_ns = clock()
+            if schedule is None:
+                slice_s = self.slice_s
+            else:
+                slice_s = min(self.slice_s, schedule.window_s)
+            for entry in adapter.start_scan(minimum_rssi=-127, timeout=slice_s):
+                if is_exposure_notification(entry.advertisement_bytes):
+                    queue.put(entry, clock())
+                else:
+                    self.others += 1
+            now_ns = clock()
+            stats.record(start_ns, start_ns, now_ns)
+            if queue.count:
+                self._ready.set()
+            if self.follow_clock:
+                self._wake()
+            if schedule is not None and schedule.interval_s > schedule.window_s:
+                ### Radio off until the next interval, the other tasks run meanwhile
+                await self._idle(start_ns + int(schedule.interval_s * slice_s / schedule.window_s
+                                                * 1000000000))
+                now_ns = clock()
+            if schedule is not None and now_ns - scan_start_ns >= schedule.timeout_s * 1000000000:
+                schedule.update(now_ns - scan_start_ns, scanner.adverts - adverts)
+                adverts = scanner.adverts
+                scan_start_ns = now_ns
+            if getattr(adapter, "done", False):
+                ### End of a replay, process what is left then stop
+                self._drain()
+                self.stop()
+                return
+            ### Let the other tasks run between two slices
+            await asyncio.sleep(0)
+
+    def _drain(self):
+        """Take all the entries of the queue into the table."""
+        scanner = self.scanner
+        clock = scanner.clock
+        queue = self.queue
+        start_ns = clock()
+        while queue.count:
+            entry, put_ns = queue.get()
+            now_ns = clock()
+            self.wait.record(put_ns, put_ns, now_ns)
+            scanner.record(entry, now_ns)
+        self.stats[1].record(start_ns, start_ns, clock())
+
+    async def process(self):
+        """Take the entries from the queue into the table, when intake put some."""
+        ready = self._ready
+        while self.running:
+            await ready.wait()
+            ready.clear()
+            if self.queue.count:
+                self._drain()
+
+    def _maintain(self, now_ns):
+        self.scanner.maintain(now_ns)
+        if self.scanner.log is not None:
+            self.scanner.log.flush_page()
+
+    async def ticker(self):
+        """Tick the outputs at the time they asked for, at least every tick_ns."""
+        scanner = self.scanner
+        clock = scanner.clock
+        stats = self.stats[3]
+        due_ns = clock()
+        while self.running:
+            start_ns = clock()
+            wake_ns = start_ns + self.tick_ns
+            for output in scanner.outputs:
+                next_ns = output.tick(scanner, start_ns)
+                if next_ns is not None and next_ns < wake_ns:
+                    wake_ns = next_ns
+            stats.record(due_ns, start_ns, clock())
+            due_ns = wake_ns
+            await self.sleep_until(wake_ns)
+
+    def _input(self, now_ns):
+        if self.scanner.on_loop is not None:
+            self.scanner.on_loop(self.scanner, now_ns)
+
+    def _render(self, output):
+        scanner = self.scanner
+
+        def render(now_ns):
+            output.render(scanner, now_ns)
+        return render
+
+    async def main(self):
+        """All the tasks, until stop() (or the end of a replay)."""
+        self.running = True
+        tasks = [asyncio.create_task(self.intake()),
+                 asyncio.create_task(self.process()),
+                 asyncio.create_task(self._every(self.maintain_ns, self.stats[2], self._maintain)),
+                 asyncio.create_task(self.ticker()),
+                 asyncio.create_task(self._every(self.input_ns, self.stats[4], self._input))]
+        for index, output in enumerate(self.scanner.outputs):
+            tasks.append(asyncio.create_task(
+                self._every(self.render_ns[index], self.stats[5 + index], self._render(output))))
+        await asyncio.gather(*tasks)
+
+    def stop(self):
+        """Stop all the tasks (they end at their next run)."""
+        self.running = False
+        ### Wake the tasks waiting for an event, so they see it
+        self._ready.set()
+        self._wake(all_of_them=True)
+
+    def run(self):
+        """Run all the tasks (forever on a board)."""
+        asyncio.run(self.main())
+
+    def dump(self):
+        """Print the statistics of all the tasks."""
+        for stats in self.stats:
+            print(stats.text())
+        print(self.wait.text(), "max queued", self.queue.max_count, "dropped", self.queue.dropped,
+              "others", self.others)
@@ -0,0 +1,127 @@
+### CoronAlert Scanner adaptive scan schedule
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Choose the interval, window and timeout of each scan from what was seen.
+
+The radio listen 'window' seconds every 'interval' seconds, window/interval
+is the share of time spent scanning (the duty cycle, that costs the most
+battery). A phone advertise about 4 times per second, so in a static scene
+(the theatre) it is still seen often enough with a low duty cycle.
+
+The addresses seen are marked in a small bitmap (one bit per value of the
+first address byte), comparing it with the previous bitmap give the devices
+that arrived and left, whatever the size of the device table. A bitmap
+cover at least listen_s seconds of actual listening (several scans at low
+duty), so a device is not taken as gone just because it was missed. Then:
+ * the scene is changing: scan at full duty, with short scans to react fast
+ * the scene is static for 'static_scans' scans: back off one level, with
+   longer scans
+ * fewer than min_rate advertisements per device and per second are
+   received: step back up one level, the devices could be hidden by mistake
+
+    scanner = Scanner(rows, outputs, schedule=ScanSchedule())
+"""
+
+### (interval, window) in seconds, from full duty to 1/8
+DUTY_LEVELS = (
+    (0.1, 0.1),
+    (0.2, 0.1),
+    (0.4, 0.1),
+    (0.8, 0.1),
+)
+
+### Number of bits set in each byte value
+_BITS = bytes(bin(value).count("1") for value in range(256))
+
+
+class ScanSchedule:
+    """Scan parameters, adapted after each scan to the crowd density.
+
+    min_rate is the minimum advertisements received per device and per
+    second, 0.2 give 4 advertisements in the 20s before a device is hidden.
+    """
+
+    def __init__(self, *, levels=DUTY_LEVELS, min_timeout_s=2, max_timeout_s=10,
+                 static_scans=3, min_rate=0.2, listen_s=2):
+        self.levels = levels
+        self.min_timeout_s = min_timeout_s
+        self.max_timeout_s = max_timeout_s
+        self.static_scans = static_scans
+        self.min_rate = min_rate
+        self.listen_ns = int(listen_s * 1000000000)
+        self.level = 0
+        self.timeout_s = min_timeout_s
+        self.interval_s, self.window_s = levels[0]
+        ### Devices seen during the current and the previous scan
+        self._seen = bytearray(32)
+        self._previous = bytearray(32)
+        self._static = 0
+        ### What the current bitmap covers
+        self._elapsed_ns = 0
+        self._listened_ns = 0
+        self._adverts = 0
+        self.arrived = 0
+        self.left = 0
+        self.devices = 0
+
+    def seen(self, key):
+        """Mark the address key as seen during this scan."""
+        bucket = key[0]
+        self._seen[bucket >> 3] |= 1 << (bucket & 7)
+
+    def duty(self):
+        """Share of the time spent scanning."""
+        return self.window_s / self.interval_s
+
+    def _set_level(self, level):
+        self.level = level
+        self.interval_s, self.window_s = self.levels[level]
+
+    def update(self, elapsed_ns, adverts):
+        """Adapt to one scan of elapsed_ns where adverts were received."""
+        self._elapsed_ns += elapsed_ns
+        self._listened_ns += elapsed_ns * self.window_s // self.interval_s
+        self._adverts += adverts
+        if self._listened_ns < self.listen_ns:
+            return
+        elapsed_ns = self._elapsed_ns
+        adverts = self._adverts
+        self._elapsed_ns = self._listened_ns = self._adverts = 0
+
+        seen = self._seen
+        previous = self._previous
+        arrived = left = devices = 0
+        for i in range(len(seen)):
+            arrived += _BITS[seen[i] & ~previous[i] & 0xFF]
+            left += _BITS[previous[i] & ~seen[i] & 0xFF]
+            devices += _BITS[seen[i]]
+        self.arrived = arrived
+        self.left = left
+        self.devices = devices
+        ### The current scan become the previous one
+        self._previous = seen
+        self._seen = previous
+        for i in range(len(previous)):
+            previous[i] = 0
+
+        if arrived + left > max(2, devices // 8):
+            ### Devices coming and going, scan hard and often decide again
+            self._set_level(0)
+            self.timeout_s = self.min_timeout_s
+            self._static = 0
+            return
+        if devices and elapsed_ns > 0:
+            rate = adverts * 1000000000 / elapsed_ns / devices
+            if rate < self.min_rate and self.level > 0:
+                self._set_level(self.level - 1)
+                self._static = 0
+                return
+        self._static += 1
+        if self._static >= self.static_scans:
+            self._static = 0
+            if self.level < len(self.levels) - 1:
+                self._set_level(self.level + 1)
+            self.timeout_s = min(self.timeout_s * 2, self.max_timeout_s)
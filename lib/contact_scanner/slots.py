@@ -0,0 +1,53 @@
+### CoronAlert Scanner LED index allocator
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Give each device an output index (the LED, key or square it is shown on).
+
+The free index are kept in a stack sorted with the lowest on top, so
+taking one when a device appears is O(1) and always give the lowest free
+index (the devices stay packed at the start of the LED, and the CLUE
+patchwork can shrink). Giving one back when the device is forgotten move
+the free index above it, at most 'slots' of them. A device keep its
+index as long as it is in the table, so when it comes back after being
+hidden (BLUE) it is shown again on the same LED.
+"""
+
+import array
+
+### This is the value used when we don't know what RGB LED to use yet
+NO_IDX = -1
+
+
+class SlotAllocator:
+    """Free list of the index 0 to slots-1."""
+
+    def __init__(self, slots):
+        self.slots = slots
+        ### Stack of free index, the first one given is 0
+        self._free = array.array("b", list(range(slots - 1, -1, -1)))
+        self._free_n = slots
+
+    def allocate(self):
+        """Take a free index (NO_IDX if none is left)."""
+        if self._free_n == 0:
+            return NO_IDX
+        self._free_n -= 1
+        return self._free[self._free_n]
+
+    def release(self, index):
+        """Give back an index."""
+        free = self._free
+        i = self._free_n
+        ### Keep the stack sorted, the lowest index on top
+        while i > 0 and free[i - 1] < index:
+            free[i] = free[i - 1]
+            i -= 1
+        free[i] = index
+        self._free_n += 1
+
+    def available(self):
+        """Number of free index."""
+        return self._free_n
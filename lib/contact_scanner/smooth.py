@@ -0,0 +1,81 @@
+### CoronAlert Scanner RSSI smoothing
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Smooth the RSSI of each device, with hysteresis around the colour thresholds.
+
+The RSSI of two advertisements of the same phone often differ by 10dB, so
+a device standing still jump between two colours, and its LED is written
+again at every refresh. Each device keep an exponential moving average of
+its RSSI, in fixed point (1/16 dB in a small int, no float is allocated):
+
+    average += (rssi * 16 - average) >> shift
+
+With the thresholds of the colours (RSSI_VALUE), a device only change of
+band (of colour) when its average is 'margin' dB past the threshold, and
+the RSSI kept in the table stay inside the band of the device. So the
+colour only change when the phone really come closer or move away.
+"""
+
+import array
+
+from contact_scanner.table import NOT_RSSI
+
+### Fixed point: 4 bits for the fraction of dB
+_FRACTION_BITS = 4
+_HALF = 1 << (_FRACTION_BITS - 1)
+
+
+class RssiFilter:
+    """Moving average of the RSSI of each row, and its colour band."""
+
+    def __init__(self, capacity, thresholds=(), *, shift=2, margin=2):
+        self.shift = shift
+        self.margin = margin
+        self.average = array.array("h", [NOT_RSSI << _FRACTION_BITS] * capacity)
+        self.band = array.array("b", [0] * capacity)
+        ### RSSI -127..0 -> band (number of thresholds at or below the RSSI)
+        self.by_rssi = bytearray(128)
+        for rssi in range(-127, 1):
+            self.by_rssi[rssi + 127] = sum(1 for value in thresholds if rssi >= value)
+        ### Lowest and highest RSSI of each band
+        self.low = array.array("b", [NOT_RSSI + 1] + list(thresholds))
+        self.high = array.array("b", [value - 1 for value in thresholds] + [0])
+
+    def _band_of(self, rssi):
+        if rssi < NOT_RSSI:
+            rssi = NOT_RSSI
+        elif rssi > 0:
+            rssi = 0
+        return self.by_rssi[rssi + 127]
+
+    def update(self, row, rssi, new=False):
+        """Add an RSSI to row (new=True for a new device), return the RSSI to show."""
+        if new:
+            average = rssi << _FRACTION_BITS
+            band = self._band_of(rssi)
+        else:
+            average = self.average[row]
+            average += ((rssi << _FRACTION_BITS) - average) >> self.shift
+            band = self.band[row]
+        self.average[row] = average
+        smooth = (average + _HALF) >> _FRACTION_BITS
+
+        ### Change of band only 'margin' dB after the threshold
+        up = self._band_of(smooth - self.margin)
+        if up > band:
+            band = up
+        else:
+            down = self._band_of(smooth + self.margin)
+            if down < band:
+                band = down
+        self.band[row] = band
+
+        ### Keep the RSSI shown in the band of the device
+        if smooth < self.low[band]:
+            return self.low[band]
+        if smooth > self.high[band]:
+            return self.high[band]
+        return smooth
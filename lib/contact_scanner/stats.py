@@ -0,0 +1,134 @@
+### CoronAlert Scanner loop instrumentation
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Measure what the scan loop cost: heap allocated for each advertisement and
+each refresh (from gc.mem_free() deltas), number and duration of the
+garbage collections, and the worst loop latency.
+
+    stats = LoopStats()
+    scanner = Scanner(rows, outputs, stats=stats)
+    ...
+    summary_label.text = stats.text()
+
+On CPython gc.mem_free() does not exist, only the times are measured.
+"""
+
+import gc
+import time
+
+try:
+    _mem_free = gc.mem_free
+except AttributeError:
+    _mem_free = None
+
+
+def _free():
+    return _mem_free() if _mem_free is not None else 0
+
+
+class LoopStats:
+    """Counters of the scan loop, updated by the Scanner at each step."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Start counting again."""
+        self.adverts = 0
+        self.advert_bytes = 0
+        self.max_advert_bytes = 0
+        self.refreshes = 0
+        self.refresh_bytes = 0
+        self.max_refresh_bytes = 0
+        ### gc.collect() done by the scanner, with their duration
+        self.collections = 0
+        self.collect_ns = 0
+        self.max_collect_ns = 0
+        ### Collections done by the allocator (seen as memory coming back)
+        self.auto_collections = 0
+        self.loops = 0
+        self.loop_ns = 0
+        self.max_loop_ns = 0
+        self._free = _free()
+        self._used = 0
+        self._start_ns = 0
+
+    def _allocated(self):
+        """Bytes allocated since the last call, None if a collection happened meanwhile."""
+        free = _free()
+        used = self._used + self._free - free
+        self._free = free
+        self._used = 0
+        if used < 0:
+            self.auto_collections += 1
+            return None
+        return used
+
+    def loop_start(self):
+        """Beginning of the processing of an advertisement."""
+        self._start_ns = time.monotonic_ns()
+        self._free = _free()
+        self._used = 0
+
+    def advert_done(self):
+        """The advertisement is recorded in the table (it is maintained at the refresh)."""
+        used = self._allocated()
+        self.adverts += 1
+        if used is not None:
+            self.advert_bytes += used
+            self.max_advert_bytes = max(self.max_advert_bytes, used)
+
+    def refresh_done(self):
+        """The table has been maintained and the outputs rendered."""
+        used = self._allocated()
+        self.refreshes += 1
+        if used is not None:
+            self.refresh_bytes += used
+            self.max_refresh_bytes = max(self.max_refresh_bytes, used)
+
+    def loop_done(self):
+        """End of the processing of an advertisement."""
+        loop_ns = time.monotonic_ns() - self._start_ns
+        self.loops += 1
+        self.loop_ns += loop_ns
+        self.max_loop_ns = max(self.max_loop_ns, loop_ns)
+
+    def collect(self):
+        """gc.collect(), timed (the memory allocated before it is still counted)."""
+        self._used += self._free - _free()
+        start_ns = time.monotonic_ns()
+        gc.collect()
+        collect_ns = time.monotonic_ns() - start_ns
+        self._free = _free()
+        self.collections += 1
+        self.collect_ns += collect_ns
+        self.max_collect_ns = max(self.max_collect_ns, collect_ns)
+
+    def text(self):
+        """One line (40 characters) for a summary label."""
+        return "A:{:<4d} R:{:<5d} GC:{:<3d}{:>4d}ms L:{:<4d}ms".format(
+            self.advert_bytes // max(self.adverts, 1),
+            self.refresh_bytes // max(self.refreshes, 1),
+            self.collections + self.auto_collections,
+            self.max_collect_ns // 1000000,
+            self.max_loop_ns // 1000000)
+
+    def dump(self):
+        """Print all the counters on the serial console."""
+        print("Adverts:", self.adverts,
+              "bytes/advert:", self.advert_bytes // max(self.adverts, 1),
+              "max:", self.max_advert_bytes)
+        print("Refreshes:", self.refreshes,
+              "bytes/refresh:", self.refresh_bytes // max(self.refreshes, 1),
+              "max:", self.max_refresh_bytes)
+        print("Collections:", self.collections,
+              "mean ms:", self.collect_ns / max(self.collections, 1) / 1000000,
+              "max ms:", self.max_collect_ns / 1000000,
+              "by allocator:", self.auto_collections)
+        print("Loops:", self.loops,
+              "mean ms:", self.loop_ns / max(self.loops, 1) / 1000000,
+              "max ms:", self.max_loop_ns / 1000000)
+        print("Memfree:", _free())
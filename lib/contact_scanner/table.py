@@ -0,0 +1,243 @@
+### CoronAlert Scanner device table
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Fixed size table of the devices seen recently.
+
+Each device is a row in a set of preallocated parallel arrays (last seen,
+RSSI and LED index) and a dict give the row of a key (the address).
+Updating a device that is already known change the arrays in place,
+so the scan loop does not create a new tuple for every advertisement.
+
+The rows are also linked in a list ordered by last seen (oldest first).
+As every advertisement move its row to the end of the list, the rows to
+hide or to remove are always at the start of the list: hide_old() and
+remove_old() only touch the rows crossing their deadline, and the oldest
+row to evict is the head of the list.
+"""
+
+import array
+
+from contact_scanner.slots import SlotAllocator, NO_IDX
+
+### Address that do not advertise anymore get a very low RSSI to indicate that
+NOT_RSSI = -127
+### End of the expiry list
+NIL = -1
+
+
+class DeviceTable:
+    """Preallocated table of up to 'capacity' devices.
+
+    Timestamps are kept in millisecond since the creation of the table,
+    this keep the values as small int (no allocation) for a few days.
+    Only the values are copied from the advertisement, the Advertisement
+    object itself is never kept. With names=True an extra column keep the
+    complete name (if any) of each device.
+
+    The key is expected to be ad.address.address_bytes: no formatting is done
+    when an advertisement is received, mac_text() build the text version of
+    the address only for the rows displayed and keep it for the next time
+    (the column of the texts is only made by the first mac_text()).
+
+    With slots=n each new device get an output index (index_col) between 0
+    and n-1 when it appears, and give it back when it is forgotten.
+    row_by_index give the row shown on each index (or NIL), it is None
+    without slots.
+    """
+
+    def __init__(self, capacity, *, names=False, slots=0):
+        self.capacity = capacity
+        self.count = 0
+        ### Devices that appeared since the start
+        self.created = 0
+        self._epoch_ns = None
+        ### The columns, one entry per row
+        self.last_ms = array.array("L", [0] * capacity)
+        self.rssi = array.array("b", [NOT_RSSI] * capacity)
+        self.index_col = array.array("b", [NO_IDX] * capacity)
+        self.keys = [None] * capacity
+        self.names = [None] * capacity if names else None
+        ### Made by the first mac_text(), most scanners never show the addresses
+        self._mac_texts = None
+        ### key -> row
+        self.row_by_key = {}
+        ### Stack of the rows not in use
+        self._free = list(range(capacity - 1, -1, -1))
+        ### Expiry list, ordered by last seen (head is the oldest)
+        self._prev = array.array("h", [NIL] * capacity)
+        self._next = array.array("h", [NIL] * capacity)
+        self.head = NIL
+        self._tail = NIL
+        ### First row of the list that is not hidden yet
+        self._visible = NIL
+        ### First row of the list not yet given by next_quiet()
+        self._quiet = NIL
+        ### Output index allocation
+        self._slots = SlotAllocator(slots) if slots else None
+        self.row_by_index = array.array("b", [NIL] * slots) if slots else None
+
+    def to_ms(self, time_ns):
+        """Convert a time.monotonic_ns() value to the table time base."""
+        if self._epoch_ns is None:
+            self._epoch_ns = time_ns
+        return (time_ns - self._epoch_ns) // 1000000
+
+    def update(self, key, now_ns, rssi):
+        """Record an advertisement for key, return the row used."""
+        row = self.row_by_key.get(key)
+        if row is None:
+            ### Creating a new entry, make space by forgetting the oldest if needed
+            if not self._free:
+                self.release(self.head)
+            row = self._free.pop()
+            self.keys[row] = key
+            self.row_by_key[key] = row
+            ### Take a free LED (if there is an allocator)
+            if self._slots is None:
+                self.index_col[row] = NO_IDX
+            else:
+                index = self._slots.allocate()
+                self.index_col[row] = index
+                if index != NO_IDX:
+                    self.row_by_index[index] = row
+            self.count += 1
+            self.created += 1
+        else:
+            self._unlink(row)
+        self.last_ms[row] = self.to_ms(now_ns)
+        self.rssi[row] = rssi
+        self._append(row)
+        return row
+
+    def _unlink(self, row):
+        """Take row out of the expiry list."""
+        prev_row = self._prev[row]
+        next_row = self._next[row]
+        if self._visible == row:
+            self._visible = next_row
+        if self._quiet == row:
+            self._quiet = next_row
+        if prev_row == NIL:
+            self.head = next_row
+        else:
+            self._next[prev_row] = next_row
+        if next_row == NIL:
+            self._tail = prev_row
+        else:
+            self._prev[next_row] = prev_row
+        self._prev[row] = NIL
+        self._next[row] = NIL
+
+    def _append(self, row):
+        """Add the (just seen) row at the end of the expiry list."""
+        self._prev[row] = self._tail
+        if self._tail == NIL:
+            self.head = row
+        else:
+            self._next[self._tail] = row
+        self._tail = row
+        if self._visible == NIL:
+            self._visible = row
+        if self._quiet == NIL:
+            self._quiet = row
+
+    def release(self, row):
+        """Forget the device in row."""
+        self._unlink(row)
+        del self.row_by_key[self.keys[row]]
+        self.keys[row] = None
+        self.rssi[row] = NOT_RSSI
+        index = self.index_col[row]
+        if index != NO_IDX and self._slots is not None:
+            self.row_by_index[index] = NIL
+            self._slots.release(index)
+        self.index_col[row] = NO_IDX
+        if self.names is not None:
+            self.names[row] = None
+        if self._mac_texts is not None:
+            self._mac_texts[row] = None
+        self._free.append(row)
+        self.count -= 1
+
+    def move_index(self, from_row, to_row):
+        """Give the output index of from_row to to_row (that give back its own)."""
+        index = self.index_col[from_row]
+        if index == NO_IDX:
+            return
+        own = self.index_col[to_row]
+        if own != NO_IDX:
+            self.row_by_index[own] = NIL
+            self._slots.release(own)
+        self.index_col[to_row] = index
+        self.row_by_index[index] = to_row
+        self.index_col[from_row] = NO_IDX
+
+    def used(self, row):
+        """Return True if row hold a device."""
+        return self.keys[row] is not None
+
+    def mac_text(self, row):
+        """The address of row as text (aa:bb:cc:dd:ee:ff), formatted on first use."""
+        if self._mac_texts is None:
+            self._mac_texts = [None] * self.capacity
+        text = self._mac_texts[row]
+        if text is None:
+            text = ":".join(["{:02x}".format(b) for b in reversed(self.keys[row])])
+            self._mac_texts[row] = text
+        return text
+
+    def oldest(self):
+        """Return the row of the device seen the longest time ago (or NIL)."""
+        return self.head
+
+    def count_recent(self, since_ns):
+        """Count the rows not hidden with an advertisement after since_ns."""
+        since_ms = self.to_ms(since_ns)
+        active = 0
+        ### Walk back from the newest row, stop at the first one too old
+        row = self._tail
+        while row != NIL and self.last_ms[row] >= since_ms:
+            if self.rssi[row] != NOT_RSSI:
+                active += 1
+            row = self._prev[row]
+        return active
+
+    def age_ms(self, row, then_ns):
+        """Milliseconds between the last advertisement of row and then_ns."""
+        return self.to_ms(then_ns) - self.last_ms[row]
+
+    def delete_very_old(self, rows_n):
+        """Delete older rows above the number of rows_n"""
+        while self.count > rows_n:
+            self.release(self.head)
+
+    def hide_old(self, hide_time_ns):
+        """Hide any row with a timestamp older than hide_time_ns. (setting RSSI to NOT_RSSI)"""
+        hide_ms = self.to_ms(hide_time_ns)
+        ### Only the rows between the last hidden one and the deadline are visited
+        row = self._visible
+        while row != NIL and self.last_ms[row] < hide_ms:
+            self.rssi[row] = NOT_RSSI
+            row = self._next[row]
+        self._visible = row
+
+    def next_quiet(self, quiet_time_ns):
+        """Return the next row not seen since quiet_time_ns, or NIL.
+
+        Each row is given once, until it is seen again (like hide_old(),
+        only the rows crossing the deadline are visited).
+        """
+        row = self._quiet
+        if row == NIL or self.last_ms[row] >= self.to_ms(quiet_time_ns):
+            return NIL
+        self._quiet = self._next[row]
+        return row
+
+    def remove_old(self, expire_time_ns):
+        """Delete any row with a timestamp older than expire_time_ns."""
+        expire_ms = self.to_ms(expire_time_ns)
+        while self.head != NIL and self.last_ms[self.head] < expire_ms:
+            self.release(self.head)
@@ -0,0 +1,201 @@
+### CoronAlert Scanner binary telemetry
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Send what the scanner see to a computer as small binary frames, instead
+of printing text for every advertisement.
+
+Each frame is SYNC, the length of the body, the body (kind then the
+fields of that kind, see ADVERT and SUMMARY) and a 16-bit Fletcher
+checksum of the body (two bytes). The frames are packed in a preallocated buffer (no string
+formatting) and written to the second USB serial (usb_cdc.data) without
+waiting: with a boot.py containing
+
+    import usb_cdc
+    usb_cdc.enable(console=True, data=True)
+
+The frames are limited to bytes_per_s (with bursts up to burst bytes).
+A frame over the limit, or when the computer does not read fast enough,
+is dropped and counted, the scan loop never wait for the USB. On the
+computer the Decoder find the frames back (even after a dropped or cut
+one), see tools/watch_telemetry.py.
+"""
+
+import struct
+
+from contact_scanner.outputs import Output
+
+SYNC = 0xA5
+KIND_ADVERT = 1
+KIND_SUMMARY = 2
+### Every Exposure Notification advertisement: t_ms, address type, address, RSSI, row
+ADVERT = "<BIB6sbB"
+### Every summary_ns: t_ms, advertisements since the last one, frames dropped,
+### devices tracked, addresses seen in the last 1, 5, 15 and 60 minutes
+SUMMARY = "<BIHHH4H"
+_SIZES = {KIND_ADVERT: struct.calcsize(ADVERT), KIND_SUMMARY: struct.calcsize(SUMMARY)}
+_FORMATS = {KIND_ADVERT: ADVERT, KIND_SUMMARY: SUMMARY}
+### Value of a count not known
+UNKNOWN = 0xFFFF
+### SYNC, length, then the two bytes of checksum
+_OVERHEAD = 4
+
+
+def fletcher16(data, start=0, end=None):
+    """The two sums of the Fletcher-16 checksum of data[start:end]."""
+    if end is None:
+        end = len(data)
+    low = 0
+    high = 0
+    for i in range(start, end):
+        low = (low + data[i]) % 255
+        high = (high + low) % 255
+    return low, high
+
+
+class Telemetry(Output):
+    """Write advertisement and summary frames to serial (usb_cdc.data), dropping instead of waiting.
+
+    As an output of the Scanner it send a summary every summary_ns, the
+    advertisements are given by the script with advert() (adverts=False
+    to send only the summaries).
+    """
+
+    def __init__(self, serial, *, bytes_per_s=4000, burst=512, max_waiting=256,
+                 summary_ns=1000 * 1000 * 1000, adverts=True):
+        self.serial = serial
+        try:
+            ### Never wait for the computer
+            serial.write_timeout = 0
+        except AttributeError:
+            pass
+        self.bytes_per_s = bytes_per_s
+        self.burst = burst
+        self.max_waiting = max_waiting
+        self.summary_ms = summary_ns // 1000000
+        self.adverts = adverts
+        self._frame = bytearray(_OVERHEAD + max(_SIZES.values()))
+        self._view = memoryview(self._frame)
+        self._tokens = burst
+        self._last_ms = None
+        self._start_ns = None
+        self._next_summary_ms = 0
+        self._summary_adverts = 0
+        self.sent = 0
+        self.dropped = 0
+        self.bytes = 0
+
+    def _ms(self, now_ns):
+        if self._start_ns is None:
+            self._start_ns = now_ns
+        return (now_ns - self._start_ns) // 1000000
+
+    def _send(self, kind, now_ms):
+        """Add SYNC, length and checksum around the body packed in _frame, write it or drop it."""
+        frame = self._frame
+        size = _SIZES[kind]
+        length = size + _OVERHEAD
+        ### Rate limit (token bucket in bytes)
+        if self._last_ms is not None:
+            self._tokens = min(self.burst,
+                               self._tokens + (now_ms - self._last_ms) * self.bytes_per_s // 1000)
+        self._last_ms = now_ms
+        if self._tokens < length:
+            self.dropped += 1
+            return False
+        waiting = getattr(self.serial, "out_waiting", 0)
+        if waiting + length > self.max_waiting:
+            ### The computer is not reading
+            self.dropped += 1
+            return False
+        frame[0] = SYNC
+        frame[1] = size
+        frame[size + 2], frame[size + 3] = fletcher16(frame, 2, size + 2)
+        written = self.serial.write(self._view[:length])
+        self._tokens -= length
+        if written is not None and written < length:
+            ### Cut frame, the decoder skip it
+            self.dropped += 1
+            return False
+        self.sent += 1
+        self.bytes += length
+        return True
+
+    def advert(self, row, entry, now_ns):
+        """Send the frame of one advertisement (row None if it is not in the table)."""
+        if not self.adverts:
+            return False
+        now_ms = self._ms(now_ns)
+        address = entry.address
+        struct.pack_into(ADVERT, self._frame, 2, KIND_ADVERT, now_ms, address.type,
+                         address.address_bytes, entry.rssi, 255 if row is None else row)
+        return self._send(KIND_ADVERT, now_ms)
+
+    def render(self, scanner, now_ns):
+        """Send a summary every summary_ns."""
+        now_ms = self._ms(now_ns)
+        if now_ms < self._next_summary_ms:
+            return
+        self._next_summary_ms = now_ms + self.summary_ms
+        if scanner.distinct is not None:
+            seen = [min(count, 0xFFFF) for count in scanner.distinct.counts(now_ns)]
+        else:
+            seen = (UNKNOWN,) * 4
+        adverts = scanner.adverts - self._summary_adverts
+        self._summary_adverts = scanner.adverts
+        struct.pack_into(SUMMARY, self._frame, 2, KIND_SUMMARY, now_ms, min(adverts, 0xFFFF),
+                         self.dropped & 0xFFFF, min(scanner.devices.count, 0xFFFF),
+                         seen[0], seen[1], seen[2], seen[3])
+        self._send(KIND_SUMMARY, now_ms)
+
+
+class Decoder:
+    """Find the frames in the bytes received from a Telemetry (on the computer)."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.frames = 0
+        self.errors = 0
+
+    def feed(self, data):
+        """Add the bytes received, yield (kind, fields) for every complete frame."""
+        buffer = self._buffer
+        buffer.extend(data)
+        while True:
+            start = buffer.find(bytes((SYNC,)))
+            if start < 0:
+                buffer.clear()
+                return
+            if start:
+                self.errors += 1
+                del buffer[:start]
+            if len(buffer) < 3:
+                return
+            size = buffer[1]
+            body = bytes(buffer[2:size + 2])
+            kind = body[0] if body else None
+            if _SIZES.get(kind) != size:
+                ### Not a frame start (a cut frame, or SYNC inside a frame)
+                self.errors += 1
+                del buffer[:1]
+                continue
+            length = size + _OVERHEAD
+            if len(buffer) < length:
+                return
+            low, high = fletcher16(body)
+            if low != buffer[size + 2] or high != buffer[size + 3]:
+                self.errors += 1
+                del buffer[:1]
+                continue
+            if len(buffer) > length and buffer[length] != SYNC:
+                ### A frame is always followed by the start of the next one (the
+                ### frames are only cut at their end), this one is a cut frame
+                ### completed by the head of the next one
+                self.errors += 1
+                del buffer[:1]
+                continue
+            del buffer[:length]
+            self.frames += 1
+            yield kind, struct.unpack(_FORMATS[kind], body)[1:]
@@ -19,9 +19,11 @@ The number of square available grow dynamically based on the need.
 It is optimised for efficiency on displayio:
 * a bitmap bitmap is created containing unique color from a palette for each pixel_shader
 * to display on the full screen, the scalling option is used
-* changing the color of one square only require to change the right color in the palette
+* changing the color of one square only require to change the right color in the palette,
+  and only the colors that changed are written (a shadow of the palette is kept)
 
-Currently the size can only increase, but option to resqueeze if less square are need is investigated
+Each size of grid is built once (contact_scanner.patchwork) and the grids are swapped,
+the grid grow at once and shrink when less square are needed for a while.
 """
 
 ### Copyright (c) 2020 David Glaude
@@ -62,13 +64,15 @@ import displayio
 from adafruit_neotrellis.neotrellis import NeoTrellis
 
 from adafruit_ble import BLERadio
-from adafruit_ble.advertising.standard import Advertisement
 
+### Shared scanner code (copy lib/contact_scanner to the lib directory of the board)
+from contact_scanner.engine import Scanner
+from contact_scanner.outputs import PixelOutput, TrellisOutput, PatchworkOutput
+from contact_scanner.colors import ColorTable
+from contact_scanner.pixels import pack_color
+from contact_scanner.neotrellis import TrellisBuffer
+from contact_scanner.patchwork import PatchworkLayout, SIDES
 
-### This is the value used when we don't know what RGB LED to use yet
-NO_IDX = -3
-### Address that do not advertise anymore get a very low RSSI to indicate that
-NOT_RSSI = -127
 
 ### This is just to show then CPE start (or restart)
 BRIGHTNESS = 1
@@ -83,7 +87,7 @@ rows = 16 ### Common value for NeoTrellis, Neopixel and CLUE screen
 
 ### vvv NeoPixel vvv ###
 #strip = neopixel.NeoPixel(board.P2, rows, brightness=BRIGHTNESS)     ### CPB
-neo_strip = neopixel.NeoPixel(board.P2, rows, brightness=BRIGHTNESS)           ### CLUE with SnowPi RGB
+neo_strip = neopixel.NeoPixel(board.P2, rows, brightness=BRIGHTNESS, auto_write=False)           ### CLUE with SnowPi RGB
 ### ^^^ NeoPixel ^^^ ###
 
 
@@ -99,10 +103,12 @@ if TRELLIS_PRESENT:
     i2c_bus = board.I2C()
     # create the trellis
     trellis = NeoTrellis(i2c_bus)
+    trellis.pixels.auto_write = False
+    ### The keys are sent in bulk, a few I2C transfers per frame (contact_scanner.neotrellis)
+    trellis_frame = TrellisBuffer(trellis, rows)
 
 
 
-last_seen_update_ns = time.monotonic_ns()
 # Reintroduce screen_update_ns to limit call to change color
 screen_update_ns = 250 * 1000 * 1000
 
@@ -115,9 +121,6 @@ scan_time_s = 10
 ble = BLERadio()
 ble.name = "CPB"
 
-### An array of timestamp and advertisement by key (addr)
-last_ad_by_key = {}
-
 MINI_BLUE = (0, 0, 1)
 
 SHADE_BLUE = [
@@ -148,54 +151,8 @@ RSSI_COLOR = [(0, 255, 0), (127, 255, 0), (127, 127, 0), (255, 127, 0), (255, 19
 RSSI_VALUE = [-80, -75, -70, -65, -60, -55]
 
 
-### Decide color based on rssi and age_ns
-def gimme_color(age_ns, rssi):
-    if rssi == NOT_RSSI:
-        result_color = MINI_BLUE
-        for i in range(len(TIME_BLUE)):
-            if age_ns < TIME_BLUE[i]:
-                result_color = SHADE_BLUE[i]
-                break
-    else:
-        result_color = RSSI_DEFAULT_COLOR
-        for i in range(len(RSSI_VALUE)):
-            if rssi < RSSI_VALUE[i]:
-                result_color = RSSI_COLOR[i]
-                break
-    return ( result_color )
-
-
-def delete_very_old(rows_n, ad_by_key):
-    """Delete older key above the number of rows_n"""
-    ### If we have more entry than space
-    if len(ad_by_key)>rows_n:
-        ### Sort by last seen to identify earliest that should be cleaned
-        sorted_data = sorted(ad_by_key.items(), key=lambda item: (item[1][1]))
-        ### Number of entries to remove
-        to_delete = len(ad_by_key)-rows_n
-        ### Iterate on the first entry and delete them from the list received
-        for key, value in sorted_data[:to_delete]:
-            ### Delete such entry
-            del ad_by_key[key]
-
-
-def hide_old(ad_by_key, hide_time_ns):
-    """Hide any entry in the ad_by_key dict with a timestamp older than hide_time_ns. (setting RSSI to -255)"""
-    ### the list() is needed to make a real list from the iterator
-    ### which allows modification of the dict inside the loop
-    for key, value in list(ad_by_key.items()):
-        if value[1] < hide_time_ns:
-            ad_by_key[key] = (value[0], value[1], NOT_RSSI, value[3])
-
-
-def remove_old(ad_by_key, expire_time_ns):
-    """Delete any entry in the ad_by_key dict with a timestamp older than expire_time_ns."""
-    ### the list() is needed to make a real list from the iterator
-    ### which allows modification of the dict inside the loop
-    for key, value in list(ad_by_key.items()):
-        if value[1] < expire_time_ns:
-            del ad_by_key[key]
-
+### Decide color based on rssi and age (lookup tables built once from the values above)
+colors = ColorTable(RSSI_VALUE, RSSI_COLOR, RSSI_DEFAULT_COLOR, TIME_BLUE, SHADE_BLUE, MINI_BLUE)
 
 
 MAX_COLOR = 225
@@ -205,207 +162,79 @@ COLOR_OFFWHITE_INDEX = 1
 
 display = board.DISPLAY
 
-max_color = [1, 5, 10, 17, 26, 37, 65, 101, 145, 226]
-side_color = [1, 2, 3, 4, 5, 6 , 8, 10, 12, 15]
-scale_color = [240, 120, 80, 60, 48, 40, 30, 24, 20, 16]
-
-
-"""
-Filling using a growing pattern.
-Only works on square.
-Each position get a unique palette colour.
-"""
-def prefil_bitmap(my_bitmap):
-#    print(bitmap.width, bitmap.height)
-    val = 2
-    for limit in range(0, my_bitmap.width):
-        if (limit % 2) == 0:
-            for i in range(0, limit):
-                my_bitmap[i, limit] = val
-                val = val + 1
-            for j in range(limit, -1, -1):
-                my_bitmap[limit, j] = val
-                val = val + 1
-        else:
-            for i in range(0, limit):
-                my_bitmap[limit, i] = val
-                val = val + 1
-            for j in range(limit, -1, -1):
-                my_bitmap[j, limit] = val
-                val = val + 1
-
-
-# Create a bitmap with two colors + 36 colors for the palette_mapping
-bitmap = displayio.Bitmap(4, 4, 16 + 2)
-# Pre-fill the bitmap with 38 colors (color 0 and 1 are reserved)
-prefil_bitmap(bitmap)
 # Create an empty palette that will be used in one to one mapping
 palette_mapping = displayio.Palette(MAX_COLOR + 3)
 
 
-def make_transparent():
-    palette_mapping.make_transparent(0)
-    for i in range(0, bitmap.height):
-        for j in range(0, bitmap.width):
-            bitmap[i, j] = 0
-
-
 def make_white():
     for i in range (2, MAX_COLOR + 2):
         palette_mapping[i] = 0xFFFFFF
 
 
-def make_black():
-    for i in range (2, MAX_COLOR + 2):
-        palette_mapping[i] = 0x000000
-
+# Create a Group with room for every level of the patchwork
+group = displayio.Group(max_size=len(SIDES))
+# Add the Group to the Display
+display.show(group)
 
-def make_palette():
-    palette_mapping[0] = 0x000000
-    palette_mapping[1] = 0xFFFFFF
-    for i, color in enumerate(array_of_pixels): ### This might crash if above 100 ###
-        palette_mapping[i+2] = color
+### The grids of squares are built once and swapped, the grid grow with the
+### number of devices and shrink (slowly) when they leave
+layout = PatchworkLayout(group, palette_mapping)
 
+### The CLUE squares, with a shadow of the palette: only the entries that changed are written
+patchwork = PatchworkOutput(palette_mapping, rows, colors, layout=layout)
 
-# Create a TileGrid using the Bitmap and Palette
-tile_grid = displayio.TileGrid(bitmap, pixel_shader=palette_mapping)
-patchwork_group = displayio.Group(scale=30)
-patchwork_group.append(tile_grid)
-# Create a Group
-group = displayio.Group()
-# Add the TileGrid to the Group
-group.append(patchwork_group)
-# Add the Group to the Display
-display.show(group)
+### Colours of the startup animation, packed once
+GREY = 0x888888
+BLUE = pack_color((0, 0, 255))
+BLACK = 0x000000
 
-array_of_pixels = [0x888888]*rows
-
-max_color = [1, 5, 10, 17, 26, 37, 65, 101, 145, 226]
-side_color = [1, 2, 3, 4, 5, 6 , 8, 10, 12, 15]
-scale_color = [240, 120, 80, 60, 48, 40, 30, 24, 20, 16]
-
-best_resolution = -1
-def adapt_resolution(to_fit):
-    global best_resolution, patchwork_group, tile_grid, bitmap
-    # Check the best resolution we should use for 'to_fit' element.
-    best = 0
-    for i, max_c in enumerate(max_color):
-        best = i
-        if max_c > to_fit:
-            break
-    # Rebuild a new bitmap scale if needed
-    if best_resolution!=best:
-        group.remove(patchwork_group)
-        bitmap = displayio.Bitmap(side_color[best], side_color[best], max_color[best] + 1)
-        prefil_bitmap(bitmap)
-        tile_grid = displayio.TileGrid(bitmap, pixel_shader=palette_mapping)
-        patchwork_group = displayio.Group(scale=scale_color[best])
-        patchwork_group.append(tile_grid)
-        group.append(patchwork_group)
-    best_resolution=best
+array_of_pixels = [GREY]*rows
 
 
 def draw_grid():
+    frame = patchwork.frame
     for i, color in enumerate(array_of_pixels):
-        if i <= MAX_COLOR:
-            palette_mapping[i+2] = color
-#            palette_mapping[i+2] = color & 0xFFFFFF ### Mask 0xFFFFFF to avoid invalid color.
-
-
-def update_screen(rows_n, ad_by_key, then_ns):
-    """Colour is used to indicate the power of the signal or absence or recent signal."""
-####    possible = list(range(rows_n))
-    possible = list ( range (rows_n-1,-1,-1) )
-    ### Sort by the MAC field
-    sorted_data = sorted(ad_by_key.items(), key=lambda item: (item[0]))
-
-    ### Scan all element and see what index are already in use
-    for key, value in sorted_data[:rows_n]:
-        ad, ad_time_ns, rssi, index_col = value
-        if index_col != NO_IDX:
-            possible.remove(index_col)
-
-    ### Scan all element and attribute index for those without one
-    for key, value in sorted_data[:rows_n]:
-        ad, ad_time_ns, rssi, index_col = value
-        if index_col == NO_IDX:
-            new_index=possible.pop()
-            ad_by_key[key] = (ad, ad_time_ns, rssi, new_index)
-
-    ### Scan all element to display the color
-    sorted_data = sorted(ad_by_key.items(), key=lambda item: (item[0]))
-    for key, value in sorted_data[:rows_n]:
-        ad, ad_time_ns, rssi, index_col = value
-        age_ns = then_ns - ad_time_ns
-        pixel_color=gimme_color(age_ns, rssi)
-        little_index=index_col & 0xFF
-        neo_strip[index_col]=pixel_color
-        if TRELLIS_PRESENT:
-            trellis.pixels[index_col]=pixel_color
-        array_of_pixels[little_index]=pixel_color
-        time.sleep(0.01)
-
-    ### Scan unused index to clear the color
-    for index in possible:
-        neo_strip[index]=(0, 0, 0)
-        if TRELLIS_PRESENT:
-            trellis.pixels[index]=(0, 0, 0)
-        array_of_pixels[index]=(0, 0, 0)
-        time.sleep(0.01)
-    draw_grid()
+        frame[i] = color
+    frame.show()
 
 
-size_to_fit = len(array_of_pixels)
-adapt_resolution(size_to_fit)
+### Start with room for all the rows (for the startup animation)
+layout.fit(len(array_of_pixels), time.monotonic_ns())
 
 
-#make_black()
 make_white()
 draw_grid()
 
 # cycle the LEDs on startup
 for i in range(16):
-    array_of_pixels[i] = (0, 0, 255)
+    array_of_pixels[i] = BLUE
     draw_grid()
     if TRELLIS_PRESENT:
-        trellis.pixels[i] = (0, 0, 31)
+        trellis_frame[i] = (0, 0, 31)
+        trellis_frame.show()
     neo_strip[i]=(0, 0, 31)
+    neo_strip.show()
     time.sleep(0.05)
 for i in range(16):
-    array_of_pixels[i] = (0, 0, 0)
+    array_of_pixels[i] = BLACK
     draw_grid()
     if TRELLIS_PRESENT:
-        trellis.pixels[i] = (0, 0, 0)
+        trellis_frame[i] = (0, 0, 0)
+        trellis_frame.show()
     neo_strip[i]=(0, 0, 0)
+    neo_strip.show()
     time.sleep(0.05)
 draw_grid()
 
 
-while True:
-    ### For all the advertisement
-    for ad in ble.start_scan(minimum_rssi=-127, timeout=scan_time_s):
-        ### Take the timestamp
-        now_ns = time.monotonic_ns()
-        ### If this is a contact tracing advertisement
-        if 3 in ad.data_dict:
-            if ad.data_dict[3] == b'o\xfd':
-                ### Found a Contact Tracing advertisement.
-                addr_text = "".join(["{:02x}".format(b) for b in reversed(ad.address.address_bytes)])
-                if addr_text in last_ad_by_key:
-                    ### Updating existing entry with a new timestamp
-                    last_ad_by_key[addr_text] = (ad, now_ns, ad.rssi, last_ad_by_key[addr_text][3])
-                else:
-                    ### Creating a new entry, but we don't know what RGB LED to use yet, so NO_IDX
-                    last_ad_by_key[addr_text] = (ad, now_ns, ad.rssi, NO_IDX)
-        delete_very_old(rows, last_ad_by_key)
-        hide_old(last_ad_by_key, time.monotonic_ns() - hide_time_ns)
-        remove_old(last_ad_by_key, time.monotonic_ns() - stale_time_ns)
-        if now_ns - last_seen_update_ns > screen_update_ns:
-            update_screen(rows, last_ad_by_key, now_ns)
-            last_seen_update_ns = now_ns
-
-### This code permit to adapt the number of Square displayed on the Clue screen
-#    size_to_fit = len(nearby_colors)
-#    adapt_resolution(size_to_fit)
-#    draw_grid()
-#    time.sleep(1)
+### The same colour is shown on the NeoPixel, the NeoTrellis and the CLUE screen
+outputs = [PixelOutput(neo_strip, rows, colors), patchwork]
+if TRELLIS_PRESENT:
+    outputs.append(TrellisOutput(trellis, rows, colors))
+
+### Scan forever, the outputs are refreshed by the scanner
+scanner = Scanner(rows, outputs,
+                  hide_time_ns=hide_time_ns, stale_time_ns=stale_time_ns,
+                  scan_time_s=scan_time_s, refresh_ns=screen_update_ns,
+                  rssi_bands=RSSI_VALUE)
+scanner.run()
@@ -0,0 +1,251 @@
+### Analyse the logs of several scanners, on a computer (needs NumPy)
+###
+### python3 tools/analyse_log.py board1.bin board2.bin ... [--minutes minutes.csv]
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Crunch the logs written by contact_scanner.flashlog (weeks of them, from
+several boards) without a loop over the records.
+
+Each log file is memory mapped and seen as a NumPy structured array of
+records (RECORD_DTYPE), then everything is done with array operations:
+
+per minute  different addresses seen in each minute (like DistinctCounter),
+            and devices shown (seen in the last hide time, like the LEDs)
+RSSI        records in each colour band of RSSI_VALUE
+dwell       time between the first and last advertisement of a visit (an
+            address not seen for stale time start a new visit)
+rotation    visits ending when a new address appear (a phone changing its
+            random address, like RotationLinker), and the life of those
+            addresses
+
+The defaults are the constants of the scanners (HIDE_TIME_NS and
+STALE_TIME_NS of contact_scanner.engine, RSSI_VALUE of the scripts, the
+minute of DistinctCounter and the link window of RotationLinker), so the
+numbers are the ones the boards would show.
+"""
+
+import argparse
+import os
+import struct
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+from contact_scanner.presets import RSSI_VALUE
+from contact_scanner.engine import HIDE_TIME_NS, STALE_TIME_NS
+from contact_scanner.distinct import WINDOWS_S
+from contact_scanner.linker import RotationLinker
+from contact_scanner.flashlog import (HEADER, MAGIC, VERSION, RECORD_SIZE, EVENT_START)
+
+RECORD_DTYPE = np.dtype([("t_ms", "<u4"), ("addr", "<u2"), ("rssi", "i1"), ("event", "u1")])
+assert RECORD_DTYPE.itemsize == RECORD_SIZE
+
+### Limits of the dwell time distribution, in seconds
+DWELL_EDGES_S = (0, 10, 30, 60, 120, 300, 600, 900, 1800, 3600)
+
+_LINK = RotationLinker.__init__.__kwdefaults__
+
+
+def load(path):
+    """The records of one log file, as memory mapped slices (oldest first, not copied).
+
+    After a wrap around the oldest records are after the cursor: the two
+    parts are given one after the other instead of being joined in a copy.
+    Empty records (event 0) are still there, see load_all().
+    """
+    with open(path, "rb") as stream:
+        header = stream.read(struct.calcsize(HEADER))
+    (magic, version, record_size, page_size,
+     capacity, cursor, wrapped, sessions) = struct.unpack(HEADER, header)
+    if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+        raise ValueError("{}: not a log file".format(path))
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=page_size, shape=(capacity,))
+    if wrapped:
+        return [records[cursor:], records[:cursor]]
+    return [records[:cursor]]
+
+
+def load_all(paths):
+    """Columns of all the records of all the files, with a session number unique to each file.
+
+    The records older than the first session start still in a file (their
+    start was overwritten) get a session of their own. Only the columns
+    kept are read from each slice of the files.
+    """
+    columns = {"t_ms": [], "addr": [], "rssi": [], "session": []}
+    base = 0
+    for path in paths:
+        session_base = base
+        for records in load(path):
+            event = records["event"]
+            starts = event == EVENT_START
+            ### The sessions continue from one slice to the next
+            session = np.cumsum(starts) + session_base
+            if len(session):
+                session_base = session[-1]
+            keep = (event != 0) & ~starts
+            columns["t_ms"].append(records["t_ms"][keep].astype(np.int64))
+            columns["addr"].append(records["addr"][keep].astype(np.int64))
+            columns["rssi"].append(records["rssi"][keep].astype(np.int16))
+            columns["session"].append(session[keep].astype(np.int64))
+        base = session_base + 1
+    return {name: np.concatenate(parts) if parts else np.zeros(0, np.int64)
+            for name, parts in columns.items()}
+
+
+def visits(log, gap_ms):
+    """Split the records of each address in visits, return their columns.
+
+    A visit end when its address is not seen for gap_ms (the scanner
+    forget it).
+    """
+    order = np.lexsort((log["t_ms"], log["addr"], log["session"]))
+    session = log["session"][order]
+    addr = log["addr"][order]
+    t_ms = log["t_ms"][order]
+    rssi = log["rssi"][order]
+    new = np.ones(len(order), dtype=bool)
+    new[1:] = ((session[1:] != session[:-1]) | (addr[1:] != addr[:-1])
+               | (np.diff(t_ms) > gap_ms))
+    starts = np.flatnonzero(new)
+    ends = np.append(starts[1:], len(order)) - 1
+    return {"session": session[starts], "first_ms": t_ms[starts], "last_ms": t_ms[ends],
+            "last_rssi": rssi[ends]}
+
+
+def per_minute(log, bucket_ms):
+    """Different addresses seen in each bucket of each session."""
+    bucket = log["t_ms"] // bucket_ms
+    key = (log["session"] << 40) | (bucket << 16) | log["addr"]
+    _, counts = np.unique(np.unique(key) >> 16, return_counts=True)
+    return counts
+
+
+def shown(seen, hide_ms, bucket_ms):
+    """Devices shown (seen in the last hide_ms) at the end of each bucket of each session.
+
+    The buckets of a session start at its oldest record kept, not at its
+    start: after a wrap around the start of the oldest session is gone.
+    """
+    start = seen["first_ms"] // bucket_ms
+    end = (seen["last_ms"] + hide_ms) // bucket_ms
+    sessions, index = np.unique(seen["session"], return_inverse=True)
+    first = np.full(len(sessions), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first, index, start)
+    start = start - first[index]
+    end = end - first[index]
+    ### Buckets of each session one after the other
+    span = np.zeros(len(sessions), dtype=np.int64)
+    np.maximum.at(span, index, end + 1)
+    base = np.concatenate(([0], np.cumsum(span)[:-1]))
+    change = np.zeros(span.sum() + 1, dtype=np.int64)
+    np.add.at(change, base[index] + start, 1)
+    np.add.at(change, base[index] + end + 1, -1)
+    return np.cumsum(change)[:-1]
+
+
+def rssi_bands(log, thresholds):
+    """Records in each band of RSSI (below the first threshold, then from each threshold)."""
+    bands = np.searchsorted(np.asarray(thresholds), log["rssi"], side="right")
+    return np.bincount(bands, minlength=len(thresholds) + 1)
+
+
+def rotations(seen, before_ms, after_ms, min_rssi):
+    """Visits ending when another one start (a new random address), and visits starting
+    when another one end, as two boolean arrays."""
+    ### One time line for all the sessions
+    first = (seen["session"] << 40) + seen["first_ms"]
+    last = (seen["session"] << 40) + seen["last_ms"]
+    ### The visit itself does not count
+    own = (last - first) <= before_ms
+    starts = np.sort(first)
+    low = np.searchsorted(starts, last - before_ms, side="left")
+    high = np.searchsorted(starts, last + after_ms, side="right")
+    ended = ((high - low - own) > 0) & (seen["last_rssi"] >= min_rssi)
+    ### Same window, seen from the new address
+    ends = np.sort(last[ended])
+    low = np.searchsorted(ends, first - after_ms, side="left")
+    high = np.searchsorted(ends, first + before_ms, side="right")
+    started = (high - low - (own & ended)) > 0
+    return ended, started
+
+
+def _spread(name, values, unit=""):
+    if len(values) == 0:
+        print("{:28s} none".format(name))
+        return
+    print("{:28s} mean {:8.1f}{}  p50 {:8.1f}{}  p95 {:8.1f}{}  max {:8.1f}{}".format(
+        name, values.mean(), unit, np.percentile(values, 50), unit,
+        np.percentile(values, 95), unit, values.max(), unit))
+
+
+def report(log, *, bucket_s, hide_s, stale_s, thresholds, before_ms, after_ms, min_rssi,
+           minutes_csv=None):
+    """Print all the statistics of the records."""
+    bucket_ms = int(bucket_s * 1000)
+    print("{} records, {} sessions, {} different address ids".format(
+        len(log["t_ms"]), len(np.unique(log["session"])), len(np.unique(log["addr"]))))
+    if len(log["t_ms"]) == 0:
+        return
+
+    counts = per_minute(log, bucket_ms)
+    seen = visits(log, int(stale_s * 1000))
+    present = shown(seen, int(hide_s * 1000), bucket_ms)
+    print()
+    _spread("addresses per {}s".format(bucket_s), counts)
+    _spread("shown (seen in {}s)".format(hide_s), present)
+    if minutes_csv is not None:
+        np.savetxt(minutes_csv, present, fmt="%d", header="shown", comments="")
+
+    print()
+    bands = rssi_bands(log, thresholds)
+    names = ["< {}".format(thresholds[0])] + [">= {}".format(value) for value in thresholds]
+    for name, count in zip(names, bands):
+        print("RSSI {:8s} {:10d} {:5.1f}%".format(name, count, 100 * count / len(log["rssi"])))
+
+    print()
+    dwell_s = (seen["last_ms"] - seen["first_ms"]) / 1000
+    edges = np.append(np.asarray(DWELL_EDGES_S, dtype=float), np.inf)
+    histogram, _ = np.histogram(dwell_s, bins=edges)
+    for low, count in zip(DWELL_EDGES_S, histogram):
+        print("dwell >= {:5d}s {:10d} {:5.1f}%".format(low, count, 100 * count / len(dwell_s)))
+    _spread("dwell of {} visits".format(len(dwell_s)), dwell_s / 60, "m")
+
+    print()
+    ended, started = rotations(seen, before_ms, after_ms, min_rssi)
+    hours = dwell_s.sum() / 3600
+    print("{:28s} {:d} ({:.2f} per device hour)".format("rotations", ended.sum(),
+                                                       ended.sum() / hours if hours else 0.0))
+    ### Life of the addresses that started and ended with a rotation
+    _spread("address life", dwell_s[ended & started] / 60, "m")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("logs", nargs="+", help="log files copied from the boards")
+    parser.add_argument("--bucket", type=float, default=WINDOWS_S[0],
+                        help="seconds of each bucket ({})".format(WINDOWS_S[0]))
+    parser.add_argument("--hide", type=float, default=HIDE_TIME_NS / 1e9,
+                        help="seconds a device is shown after its last advertisement ({:g})".format(
+                            HIDE_TIME_NS / 1e9))
+    parser.add_argument("--stale", type=float, default=STALE_TIME_NS / 1e9,
+                        help="seconds before a device is forgotten, end of a visit ({:g})".format(
+                            STALE_TIME_NS / 1e9))
+    parser.add_argument("--thresholds", type=int, nargs="+", default=RSSI_VALUE,
+                        help="RSSI of the colour bands ({})".format(
+                            " ".join(str(value) for value in RSSI_VALUE)))
+    parser.add_argument("--minutes", help="write the devices shown in each bucket to this CSV file")
+    args = parser.parse_args()
+    report(load_all(args.logs), bucket_s=args.bucket, hide_s=args.hide, stale_s=args.stale,
+           thresholds=sorted(args.thresholds),
+           before_ms=_LINK["before_ns"] // 1000000, after_ms=_LINK["after_ns"] // 1000000,
+           min_rssi=_LINK["min_rssi"], minutes_csv=args.minutes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+### Benchmark of all the scanners on the synthetic crowds
+###
+### python3 tools/bench.py [--duration 300] [--seed 2020] [--profile cpb_corona] [--scenario theatre]
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Run the tracking and rendering of each script (profiles.py) on each
+synthetic crowd (crowd.py) and report, per advertisement:
+
+us/adv     mean time to process an advertisement (with the refresh)
+p99 us     99th percentile of that time
+B/adv      heap allocated (and released) while processing an advertisement
+state KB   peak heap kept by the scanner (table, counters, outputs)
+refresh us mean and max time of a refresh (maintain and render)
+
+The scanners are run like their script (profiles.drive): by Scanner.scan()
+with the ScanSchedule of the script, or by the Runtime for the blink
+scripts (their us/adv is then Scanner.record in the process task, the
+filter being done by intake and the refresh apart, and refresh us the
+maintain task, the render being a task apart).
+
+The times are measured in a first pass, the memory in a second pass with
+tracemalloc (that slows everything down). The crowds are seeded, so a
+change of the numbers comes from the code, not from the workload.
+On CPython every int above 256 is an allocation, so B/adv is only meant
+to compare two versions of the code, not to predict the heap of a board.
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from profiles import PROFILES, RUNTIME, drive
+from crowd import SCENARIOS, crowd
+
+from contact_scanner.capture import ReplayAdapter
+
+
+def _timed(function, times, *, done_only=False):
+    """function, appending the time of each call to times (only the calls returning True if done_only)."""
+    def timed(*args, **kwargs):
+        start_ns = time.perf_counter_ns()
+        result = function(*args, **kwargs)
+        if not done_only or result:
+            times.append(time.perf_counter_ns() - start_ns)
+        return result
+    return timed
+
+
+def timing_pass(profile, records):
+    """Return (time of each advertisement, time of each refresh) in ns."""
+    adapter = ReplayAdapter(records)
+    scanner = PROFILES[profile](adapter=adapter, clock=adapter.clock)
+    latencies = []
+    refreshes = []
+    if profile in RUNTIME:
+        ### The tasks of the Runtime: an advertisement, then maintain and render apart
+        scanner.record = _timed(scanner.record, latencies)
+        scanner.maintain = _timed(scanner.maintain, refreshes)
+    else:
+        scanner.step = _timed(scanner.step, latencies)
+        scanner.refresh = _timed(scanner.refresh, refreshes, done_only=True)
+    drive(profile, scanner)
+    return latencies, refreshes
+
+
+def memory_pass(profile, records):
+    """Return (mean bytes allocated per advertisement, peak bytes kept by the scanner)."""
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        adapter = ReplayAdapter(records)
+        scanner = PROFILES[profile](adapter=adapter, clock=adapter.clock)
+        transient = 0
+        adverts = 0
+        peak_state = 0
+
+        def measured(function):
+            def step(*args):
+                nonlocal transient, adverts, peak_state
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                result = function(*args)
+                current, peak = tracemalloc.get_traced_memory()
+                transient += peak - before
+                adverts += 1
+                ### The replay itself (entry, adapter) is a few hundred bytes at most
+                peak_state = max(peak_state, current - base)
+                return result
+            return step
+
+        if profile in RUNTIME:
+            scanner.record = measured(scanner.record)
+        else:
+            scanner.step = measured(scanner.step)
+        drive(profile, scanner)
+    finally:
+        tracemalloc.stop()
+    return transient // max(adverts, 1), peak_state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scanners on the synthetic crowds.")
+    parser.add_argument("--duration", type=int, default=300, help="seconds of each crowd (300)")
+    parser.add_argument("--seed", type=int, default=2020)
+    parser.add_argument("--profile", choices=sorted(PROFILES), action="append",
+                        help="script to run (all of them by default)")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), action="append",
+                        help="crowd to use (all of them by default)")
+    args = parser.parse_args()
+
+    print("{:12s} {:28s} {:>7s} {:>7s} {:>7s} {:>6s} {:>9s} {:>10s} {:>9s}".format(
+        "scenario", "profile", "adverts", "us/adv", "p99 us", "B/adv", "state KB",
+        "refresh us", "max us"))
+    for scenario in args.scenario or SCENARIOS:
+        records = list(crowd(scenario, duration_s=args.duration, seed=args.seed))
+        for profile in args.profile or PROFILES:
+            latencies, refreshes = timing_pass(profile, records)
+            per_advert, peak_state = memory_pass(profile, records)
+            ordered = sorted(latencies)
+            print("{:12s} {:28s} {:7d} {:7.1f} {:7.1f} {:6d} {:9.1f} {:10.1f} {:9.1f}".format(
+                scenario,
+                profile,
+                len(latencies),
+                sum(latencies) / max(len(latencies), 1) / 1000,
+                ordered[len(ordered) * 99 // 100] / 1000 if ordered else 0,
+                per_advert,
+                peak_state / 1024,
+                sum(refreshes) / max(len(refreshes), 1) / 1000,
+                max(refreshes, default=0) / 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+### Benchmark of the Exposure Notification filter
+###
+### python3 tools/bench_en_filter.py [--count 20000]
+### (also runs on a board, copied as code.py with lib/contact_scanner)
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Compare the filter used by the scanners until now (decode all the AD
+structures in a dict, then look at data_dict[3] and the service data)
+with the raw byte matcher of contact_scanner.advertising, on a mix of
+advertisements close to what is received in a busy place (most of them
+are not Exposure Notification).
+"""
+
+import random
+import sys
+import time
+
+try:
+    import os
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+except AttributeError:
+    ### CircuitPython has no os.path, the library is in /lib already
+    pass
+
+from contact_scanner.advertising import is_exposure_notification
+
+try:
+    from adafruit_ble.advertising import decode_data
+except ImportError:
+    import struct
+
+    def decode_data(data, *, key_encoding="B"):
+        """Same as adafruit_ble.advertising.decode_data (used by Advertisement)."""
+        data_dict = {}
+        i = 0
+        while i < len(data):
+            item_length = data[i]
+            i += 1
+            if item_length == 0:
+                break
+            struct_size = struct.calcsize(key_encoding)
+            key = struct.unpack_from(key_encoding, data, i)[0]
+            value = data[i + struct_size:i + item_length]
+            if key in data_dict:
+                if not isinstance(data_dict[key], list):
+                    data_dict[key] = [data_dict[key]]
+                data_dict[key].append(value)
+            else:
+                data_dict[key] = value
+            i += item_length
+        return data_dict
+
+
+def _rnd(n):
+    return bytes([random.getrandbits(8) for _ in range(n)])
+
+
+def _exposure_notification():
+    return b"\x02\x01\x1a\x03\x03\x6f\xfd\x17\x16\x6f\xfd" + _rnd(20)
+
+
+def _en_list_only():
+    ### Only the service UUID, no service data (not taken as Exposure Notification)
+    return b"\x02\x01\x1a\x03\x03\x6f\xfd" + b"\x07\xff\x4c\x00" + _rnd(4)
+
+
+def _apple_continuity():
+    payload = _rnd(random.choice((8, 14, 24)))
+    return b"\x02\x01\x1a" + bytes((len(payload) + 3, 0xFF)) + b"\x4c\x00" + payload
+
+
+def _microsoft_cdp():
+    return b"\x1e\xff\x06\x00\x01\x09\x20\x02" + _rnd(23)
+
+
+def _ibeacon():
+    return b"\x02\x01\x06\x1a\xff\x4c\x00\x02\x15" + _rnd(21)
+
+
+def _eddystone():
+    return b"\x02\x01\x06\x03\x03\xaa\xfe\x11\x16\xaa\xfe\x10\x00" + _rnd(12)
+
+
+def _fast_pair():
+    return b"\x02\x01\x06\x03\x03\x2c\xfe\x06\x16\x2c\xfe" + _rnd(3) + b"\x02\x0a\xf4"
+
+
+def _named_device():
+    name = b"Sensor-" + bytes(random.choice(b"0123456789ABCDEF") for _ in range(4))
+    return (b"\x02\x01\x06\x05\x03\x0f\x18\x0a\x18" + bytes((len(name) + 1, 0x09)) + name)
+
+
+### (generator, share of the traffic)
+MIX = (
+    (_apple_continuity, 45),
+    (_microsoft_cdp, 10),
+    (_named_device, 12),
+    (_fast_pair, 10),
+    (_exposure_notification, 10),
+    (_en_list_only, 1),
+    (_ibeacon, 8),
+    (_eddystone, 5),
+)
+
+
+def make_traffic(count, seed=2020):
+    """Return a list of raw advertisement bytes following MIX."""
+    random.seed(seed)
+    pool = []
+    for generator, share in MIX:
+        pool.extend([generator] * share)
+    return [random.choice(pool)() for _ in range(count)]
+
+
+def filter_data_dict(adv):
+    """The filter used by the scanners with adafruit_ble Advertisement (and the service data)."""
+    data_dict = decode_data(adv)
+    if 3 in data_dict:
+        if data_dict[3] == b'o\xfd':
+            service_data = data_dict.get(0x16, ())
+            if not isinstance(service_data, list):
+                service_data = [service_data]
+            for value in service_data:
+                if value[:2] == b'o\xfd':
+                    return True
+    return False
+
+
+def run(name, function, traffic):
+    """Time function over the traffic, return (matches, ns per advertisement)."""
+    start_ns = time.monotonic_ns()
+    matches = 0
+    for adv in traffic:
+        if function(adv):
+            matches += 1
+    elapsed_ns = time.monotonic_ns() - start_ns
+    per_ad_ns = elapsed_ns // len(traffic)
+    print("{:12s} {:6d} matches  {:8d} ns/advertisement".format(name, matches, per_ad_ns))
+    return matches, per_ad_ns
+
+
+def main():
+    count = 20000
+    try:
+        import argparse
+    except ImportError:
+        ### CircuitPython has no argparse (and no command line), keep the default
+        argparse = None
+    if argparse is not None:
+        parser = argparse.ArgumentParser(description="Benchmark the Exposure Notification filter.")
+        parser.add_argument("--count", type=int, default=count,
+                            help="advertisements in the mix ({})".format(count))
+        count = parser.parse_args().count
+    traffic = make_traffic(count)
+    print("{} advertisements".format(count))
+    matches_dict, dict_ns = run("data_dict", filter_data_dict, traffic)
+    matches_raw, raw_ns = run("raw bytes", is_exposure_notification, traffic)
+    if matches_dict != matches_raw:
+        print("ERROR: the two filters do not agree")
+    print("speedup: {:.1f}x".format(dict_ns / max(raw_ns, 1)))
+
+
+main()
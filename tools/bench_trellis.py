@@ -0,0 +1,83 @@
+### Measure the I2C traffic of the NeoTrellis output, on a computer
+###
+### python3 tools/bench_trellis.py [--duration 300] [--scenario theatre] [--check]
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Run the NeoTrellis scanner (clue_with_neotrellis.py, see profiles.py) on
+the synthetic crowds with the keys written one by one by the NeoPixel of
+adafruit_seesaw (per key) and in bulk by TrellisBuffer (bulk), both on a
+fake seesaw counting the I2C transactions and bytes, and report them per
+frame with the time they take on a 100kHz bus.
+
+With --check, the colours shown by the fake seesaw at the end must be the
+colours of the frame buffer in both cases, and bulk must take fewer
+transactions.
+"""
+
+import argparse
+
+from crowd import SCENARIOS, crowd
+from profiles import PROFILES
+
+from contact_scanner.capture import ReplayAdapter
+
+### I2C bus of the NeoTrellis
+BUS_HZ = 100000
+
+
+def bus_us(transactions, nbytes):
+    """Time on the bus: 9 bits per byte (with the address byte), start and stop."""
+    return ((nbytes + transactions) * 9 + transactions * 2) * 1000000 / BUS_HZ
+
+
+def run(records, bulk):
+    """Replay the records, return (frames, transactions, bytes, True if the keys show the frame)."""
+    adapter = ReplayAdapter(records)
+    scanner = PROFILES["clue_with_neotrellis"](adapter=adapter, clock=adapter.clock, bulk=bulk)
+    while not adapter.done:
+        scanner.scan()
+    output = scanner.outputs[0]
+    device = output.frame.pixels.i2c_device
+    expected = bytearray()
+    for index in range(output.n):
+        color = output.frame[index]
+        expected.extend(((color >> 8) & 0xFF, (color >> 16) & 0xFF, color & 0xFF))
+    return output.frame.frames, device.transactions, device.bytes, device.shown == expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--duration", type=int, default=300, help="seconds of each crowd (300)")
+    parser.add_argument("--seed", type=int, default=2020)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), action="append",
+                        help="crowd to use (all of them by default)")
+    parser.add_argument("--check", action="store_true", help="exit with an error if a check fail")
+    args = parser.parse_args()
+
+    ok = True
+    print("{:12s} {:8s} {:>7s} {:>9s} {:>9s} {:>8s} {:>8s} {:>8s}".format(
+        "scenario", "mode", "frames", "trans", "bytes", "trans/f", "bytes/f", "bus us/f"))
+    for scenario in args.scenario or SCENARIOS:
+        records = list(crowd(scenario, duration_s=args.duration, seed=args.seed))
+        results = {}
+        for bulk in (False, True):
+            frames, transactions, nbytes, shown = run(records, bulk)
+            results[bulk] = transactions
+            mode = "bulk" if bulk else "per key"
+            frames = max(frames, 1)
+            print("{:12s} {:8s} {:7d} {:9d} {:9d} {:8.1f} {:8.1f} {:8.0f}{}".format(
+                scenario, mode, frames, transactions, nbytes, transactions / frames,
+                nbytes / frames, bus_us(transactions, nbytes) / frames,
+                "" if shown else "  WRONG COLOURS"))
+            ok = ok and shown
+        ok = ok and results[True] < results[False]
+    if args.check:
+        print("OK" if ok else "WRONG")
+        raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+### Synthetic crowds of phones advertising Exposure Notification
+###
+### python3 tools/crowd.py transport capture.bin [--duration 600] [--seed 2020] [--others 15]
+### (write a capture that can be replayed with replay.py)
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Generate the advertisements received in the places described in the README:
+
+transport  constant churn, phones get in and out every few minutes
+theatre    static spectators, all there from the start to the end
+street     couples (two phones) passing by in less than a minute
+
+Each phone advertise every 200-270ms (not every advertisement is received),
+change its random address every 10-15 minutes, and its RSSI follow a random
+walk around a level given by its distance (rising then falling for the
+people passing by), plus the noise of each packet (a few dB, multipath).
+Other BLE devices (not Exposure Notification) add background traffic.
+The same seed always give the same crowd.
+
+crowd(scenario) yields (t_ms, entry) like contact_scanner.capture.read_capture,
+so it can be given directly to ReplayAdapter.
+"""
+
+import argparse
+import heapq
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+from contact_scanner.capture import (ReplayAddress, ReplayEntry, MAGIC, pack_record)
+
+SEC_MS = 1000
+MIN_MS = 60 * SEC_MS
+
+### Address type of a random address
+RANDOM_ADDRESS = 1
+
+
+class Scenario:
+    """The parameters of a place."""
+
+    def __init__(self, name, *, phones, stay_ms, arrival_ms, group=1,
+                 rssi_near=-55, rssi_far=-90, passing=False, others=10,
+                 rotation_ms=(10 * MIN_MS, 15 * MIN_MS), interval_ms=(200, 270),
+                 received=0.6, walk_db=2, noise_db=4):
+        self.name = name
+        ### Phones there at the start
+        self.phones = phones
+        ### (min, max) time a phone stays, None if it stays until the end
+        self.stay_ms = stay_ms
+        ### Mean time between two arrivals (of a group), None if nobody comes
+        self.arrival_ms = arrival_ms
+        ### Phones arriving together
+        self.group = group
+        self.rssi_near = rssi_near
+        self.rssi_far = rssi_far
+        ### RSSI rising then falling during the stay
+        self.passing = passing
+        ### Other BLE devices (not Exposure Notification) around
+        self.others = others
+        self.rotation_ms = rotation_ms
+        self.interval_ms = interval_ms
+        ### Share of the advertisements received by the scanner
+        self.received = received
+        ### Step of the RSSI random walk
+        self.walk_db = walk_db
+        ### Standard deviation of the RSSI of each packet around the walk
+        self.noise_db = noise_db
+
+
+SCENARIOS = {
+    "transport": Scenario("transport", phones=30, stay_ms=(2 * MIN_MS, 10 * MIN_MS),
+                          arrival_ms=10 * SEC_MS, group=1, others=15),
+    "theatre": Scenario("theatre", phones=80, stay_ms=None, arrival_ms=None,
+                        rssi_near=-60, rssi_far=-95, others=5, walk_db=1),
+    "street": Scenario("street", phones=4, stay_ms=(20 * SEC_MS, 60 * SEC_MS),
+                       arrival_ms=15 * SEC_MS, group=2, passing=True, others=8),
+}
+
+
+def _address(rnd):
+    return bytes(rnd.getrandbits(8) for _ in range(6))
+
+
+def _en_advertisement(rnd):
+    ### Flags, service UUID 0xFD6F, service data (16 bytes RPI + 4 bytes AEM)
+    return (b"\x02\x01\x1a\x03\x03\x6f\xfd\x17\x16\x6f\xfd"
+            + bytes(rnd.getrandbits(8) for _ in range(20)))
+
+
+def _other_advertisement(rnd):
+    ### Apple Continuity, the most common advertisement in a busy place
+    payload = bytes(rnd.getrandbits(8) for _ in range(rnd.choice((8, 14, 24))))
+    return b"\x02\x01\x1a" + bytes((len(payload) + 3, 0xFF)) + b"\x4c\x00" + payload
+
+
+class _Phone:
+    """One phone (or other device) of the crowd."""
+
+    def __init__(self, rnd, scenario, now_ms, end_ms, en=True):
+        self.en = en
+        self.start_ms = now_ms
+        self.end_ms = end_ms
+        self.level = rnd.uniform(scenario.rssi_far, scenario.rssi_near)
+        self.rssi = self.level
+        self.address = _address(rnd)
+        self.payload = _en_advertisement(rnd) if en else _other_advertisement(rnd)
+        if en:
+            self.rotate_ms = now_ms + rnd.randint(0, scenario.rotation_ms[1])
+        else:
+            self.rotate_ms = None
+
+    def advertise(self, rnd, scenario, now_ms):
+        """Return the entry of one advertisement."""
+        if self.rotate_ms is not None and now_ms >= self.rotate_ms:
+            ### New random address, and new Rolling Proximity Identifier with it
+            self.address = _address(rnd)
+            self.payload = _en_advertisement(rnd)
+            self.rotate_ms = now_ms + rnd.randint(*scenario.rotation_ms)
+        level = self.level
+        if scenario.passing and self.end_ms is not None:
+            ### Closest in the middle of the stay
+            middle = (self.start_ms + self.end_ms) / 2
+            half = max((self.end_ms - self.start_ms) / 2, 1)
+            level = scenario.rssi_near - (scenario.rssi_near - scenario.rssi_far) * abs(now_ms - middle) / half
+        self.rssi += rnd.uniform(-scenario.walk_db, scenario.walk_db) + (level - self.rssi) * 0.1
+        rssi = int(min(max(self.rssi + rnd.gauss(0, scenario.noise_db), -126), -20))
+        return ReplayEntry(ReplayAddress(self.address, RANDOM_ADDRESS), rssi, self.payload, False)
+
+
+def crowd(scenario, *, duration_s=600, seed=2020, others=None):
+    """Yield (t_ms, entry) for all the advertisements received during duration_s.
+
+    others is the number of other BLE devices (the one of the scenario by
+    default).
+    """
+    if isinstance(scenario, str):
+        scenario = SCENARIOS[scenario]
+    rnd = random.Random(seed)
+    duration_ms = duration_s * SEC_MS
+    events = []
+    sequence = 0
+
+    def add(phone, t_ms):
+        nonlocal sequence
+        heapq.heappush(events, (t_ms, sequence, phone))
+        sequence += 1
+
+    def leave_ms(now_ms):
+        if scenario.stay_ms is None:
+            return None
+        return now_ms + rnd.randint(*scenario.stay_ms)
+
+    for _ in range(scenario.phones):
+        ### Already there since a while, will leave sometime
+        add(_Phone(rnd, scenario, 0, leave_ms(-rnd.randint(0, 60 * SEC_MS))), rnd.randint(0, 270))
+    for _ in range(scenario.others if others is None else others):
+        add(_Phone(rnd, scenario, 0, None, en=False), rnd.randint(0, 1000))
+    next_arrival_ms = None
+    if scenario.arrival_ms is not None:
+        next_arrival_ms = int(rnd.expovariate(1 / scenario.arrival_ms))
+
+    while events:
+        t_ms, _, phone = heapq.heappop(events)
+        while next_arrival_ms is not None and next_arrival_ms <= t_ms:
+            end_ms = leave_ms(next_arrival_ms)
+            for _ in range(scenario.group):
+                add(_Phone(rnd, scenario, next_arrival_ms, end_ms), next_arrival_ms + rnd.randint(0, 270))
+            next_arrival_ms += int(rnd.expovariate(1 / scenario.arrival_ms)) + 1
+        if t_ms >= duration_ms:
+            break
+        if phone.end_ms is not None and t_ms >= phone.end_ms:
+            continue
+        if rnd.random() < scenario.received:
+            yield t_ms, phone.advertise(rnd, scenario, t_ms)
+        if phone.en:
+            add(phone, t_ms + rnd.randint(*scenario.interval_ms))
+        else:
+            add(phone, t_ms + rnd.randint(100, 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic capture.")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("capture", help="capture file to write")
+    parser.add_argument("--duration", type=int, default=600, help="seconds (600)")
+    parser.add_argument("--seed", type=int, default=2020)
+    parser.add_argument("--others", type=int,
+                        help="other BLE devices (background traffic, the scenario's by default)")
+    args = parser.parse_args()
+    records = 0
+    with open(args.capture, "wb") as stream:
+        stream.write(MAGIC)
+        for t_ms, entry in crowd(args.scenario, duration_s=args.duration, seed=args.seed,
+                                   others=args.others):
+            stream.write(pack_record(t_ms, entry))
+            records += 1
+    print("{} advertisements in {}".format(records, args.capture))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+### Print the log written by a scanner on its flash
+###
+### python3 tools/dump_log.py scanlog.bin [--csv]
+### python3 tools/dump_log.py --check [--scenario transport] [--size 16384]
+### (check the ring buffer with a synthetic crowd, in a file of this computer)
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Print the records of a log made by contact_scanner.flashlog, oldest first.
+
+With --check, a synthetic crowd (see crowd.py) is logged by the Scanner in a
+temporary file small enough to wrap around several times, and closed and
+opened again in the middle (a new session). The records read back must be
+the last ones written, in order, and the worst flush (one page and the
+header) is reported.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+from contact_scanner.flashlog import (FlashLog, read_log, EVENT_START, EVENT_NEW,
+                                      EVENT_SEEN)
+
+EVENT_NAMES = {EVENT_START: "start", EVENT_NEW: "new", EVENT_SEEN: "seen"}
+
+
+def dump(path, csv=False):
+    """Print all the records of the log in path."""
+    with open(path, "rb") as stream:
+        if csv:
+            print("session,t_ms,address_id,rssi,event")
+        for session, t_ms, addr_id, rssi, event in read_log(stream):
+            name = EVENT_NAMES.get(event, str(event))
+            if csv:
+                print("{},{},{:04x},{},{}".format("" if session is None else session,
+                                                  t_ms, addr_id, rssi, name))
+            else:
+                print("{:>5s} {:10.3f}s  {:04x} {:4d} {}".format(
+                    "?" if session is None else str(session), t_ms / 1000, addr_id, rssi, name))
+
+
+class _CheckedLog(FlashLog):
+    """FlashLog keeping a copy of every record, to compare with the file."""
+
+    def __init__(self, *args, **kwargs):
+        self.written = []
+        super().__init__(*args, **kwargs)
+
+    def add_event(self, event, addr_id, rssi, now_ns):
+        super().add_event(event, addr_id, rssi, now_ns)
+        self.written.append((addr_id, rssi, event))
+
+
+def check(scenario, size, duration_s):
+    """Log a crowd through the Scanner, return True if the log read back is right."""
+    from crowd import crowd
+    from profiles import PROFILES
+    from contact_scanner.capture import ReplayAdapter
+
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    os.close(fd)
+    os.remove(path)
+    written = []
+    logs = []
+    try:
+        ### Two sessions, as if the board was restarted
+        for seed in (2020, 2021):
+            log = _CheckedLog(path, size)
+            adapter = ReplayAdapter(crowd(scenario, duration_s=duration_s, seed=seed))
+            scanner = PROFILES["cpb_corona"](adapter=adapter, clock=adapter.clock, log=log)
+            while not adapter.done:
+                scanner.scan()
+            log.close()
+            written.extend(log.written)
+            logs.append(log)
+        with open(path, "rb") as stream:
+            read = [(addr_id, rssi, event) for _, _, addr_id, rssi, event in read_log(stream)]
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+    capacity = logs[0].capacity
+    expected = written[-capacity:]
+    ok = read == expected
+    print("{} records written, {} kept ({} in the file): {}".format(
+        len(written), len(read), capacity, "OK" if ok else "WRONG"))
+    for number, log in enumerate(logs, 1):
+        print("session {}: {} pages, mean flush {} us, max flush {} us".format(
+            number, log.pages, log.flush_ns // max(log.pages, 1) // 1000, log.max_flush_ns // 1000))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("log", nargs="?", help="log file copied from the board")
+    parser.add_argument("--csv", action="store_true", help="print as CSV")
+    parser.add_argument("--check", action="store_true", help="check the ring buffer on this computer")
+    parser.add_argument("--scenario", default="transport", help="crowd of the check (transport)")
+    parser.add_argument("--size", type=int, default=16 * 1024, help="log size of the check (16384)")
+    parser.add_argument("--duration", type=int, default=300, help="seconds of each session (300)")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0 if check(args.scenario, args.size, args.duration) else 1)
+    if args.log is None:
+        parser.error("a log file is needed (or --check)")
+    dump(args.log, args.csv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+### Heap used per tracked device, before and after the DeviceTable
+###
+### On a board: copy as code.py (with lib/contact_scanner on the board),
+### the report is printed on the serial console after scanning.
+### On a computer: python3 tools/heap_per_device.py (synthetic advertisements)
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Measure the heap used per tracked device.
+
+before: the old last_ad_by_key dict, one (ad, now_ns, rssi, index_col) tuple
+        per address, keeping a reference to the whole Advertisement
+after:  the DeviceTable, only the values are copied out of the advertisement
+
+On CircuitPython the Advertisement come from a real scan and the memory is
+measured with gc.mem_free(). On CPython the advertisement are synthetic
+(same layout as an Exposure Notification advertisement) and the memory is
+measured with tracemalloc, so only the ratio is meaningful there.
+"""
+
+import gc
+import os
+import sys
+import time
+
+try:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+except AttributeError:
+    ### CircuitPython has no os.path, the library is in /lib already
+    pass
+
+from contact_scanner.table import DeviceTable, NO_IDX
+
+### Number of devices to track for the measure
+devices_n = 32
+scan_time_s = 30
+
+
+def collect_board():
+    """Scan for real Exposure Notification advertisement (one per address)."""
+    from adafruit_ble import BLERadio
+    ble = BLERadio()
+    ads = {}
+    for ad in ble.start_scan(minimum_rssi=-127, timeout=scan_time_s):
+        if 3 in ad.data_dict and ad.data_dict[3] == b'o\xfd':
+            ads[ad.address.address_bytes] = ad
+            if len(ads) >= devices_n:
+                break
+    ble.stop_scan()
+    return list(ads.values())
+
+
+class _RetainedAd:
+    """What an adafruit_ble Advertisement keep alive (host approximation)."""
+
+    def __init__(self, raw, rssi):
+        self.data_dict = {}
+        i = 0
+        while i < len(raw):
+            length = raw[i]
+            if length == 0:
+                break
+            self.data_dict[raw[i + 1]] = raw[i + 2:i + 1 + length]
+            i += 1 + length
+        self.address = raw[-6:]
+        self.rssi = rssi
+        self.scan_response = False
+        self.mutable = False
+
+
+def collect_host():
+    """Build synthetic Exposure Notification advertisement."""
+    ads = []
+    for n in range(devices_n):
+        rpi = bytes((n * 7 + i) & 0xFF for i in range(20))
+        raw = b"\x02\x01\x1a" + b"\x03\x03\x6f\xfd" + b"\x17\x16\x6f\xfd" + rpi
+        ads.append(_RetainedAd(raw, -60 - n % 30))
+    return ads
+
+
+class _Meter:
+    """Heap in use, gc.mem_free() on a board and tracemalloc on CPython."""
+
+    def __init__(self):
+        self._tracemalloc = None
+        if not hasattr(gc, "mem_free"):
+            import tracemalloc
+            tracemalloc.start()
+            self._tracemalloc = tracemalloc
+
+    def used(self):
+        gc.collect()
+        if self._tracemalloc is None:
+            return -gc.mem_free()
+        return self._tracemalloc.get_traced_memory()[0]
+
+
+def measure(collect):
+    """Return the number of devices and the bytes per device (before, after).
+
+    Each figure is the memory released when the structure is dropped,
+    so it includes everything only kept alive by the tracker.
+    """
+    meter = _Meter()
+    now_ns = time.monotonic_ns()
+
+    ### before: the advertisement are only alive because of the dict
+    last_ad_by_key = {}
+    for ad in collect():
+        if isinstance(ad, _RetainedAd):
+            key = "".join(["{:02x}".format(b) for b in ad.address])
+        else:
+            key = "".join(["{:02x}".format(b) for b in reversed(ad.address.address_bytes)])
+        last_ad_by_key[key] = (ad, now_ns, ad.rssi, NO_IDX)
+    ad = None
+    devices_found = len(last_ad_by_key)
+    if devices_found == 0:
+        return 0, 0, 0
+    keys = list(last_ad_by_key.keys())
+    rssis = [value[2] for value in last_ad_by_key.values()]
+    in_use = meter.used()
+    last_ad_by_key = None
+    before = in_use - meter.used()
+
+    ### after: only the values are kept
+    table = DeviceTable(devices_found)
+    for key, rssi in zip(keys, rssis):
+        table.update(key, now_ns, rssi)
+    in_use = meter.used()
+    table = None
+    after = in_use - meter.used()
+
+    return devices_found, before / devices_found, after / devices_found
+
+
+def main():
+    if hasattr(gc, "mem_free"):
+        collect = collect_board
+        where = "advertisements from a scan (gc.mem_free)"
+    else:
+        collect = collect_host
+        where = "synthetic advertisements (CPython tracemalloc)"
+    devices_found, before, after = measure(collect)
+    if devices_found == 0:
+        print("No Exposure Notification advertisement received")
+        return
+    print("Heap per tracked device,", devices_found, where)
+    print("  before (Advertisement kept): {:7.1f} bytes".format(before))
+    print("  after  (DeviceTable row):    {:7.1f} bytes".format(after))
+
+
+main()
@@ -0,0 +1,384 @@
+### The scanners set up like the scripts, with stub hardware
+###
+### Used by the host tools (replay.py, ...) to run the tracking and
+### rendering of each script on a computer, without a board.
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Each profile build the Scanner of one script (same rows, times, colours
+and outputs) on stub hardware: the NeoPixel, NeoTrellis, palette, labels,
+patchwork grids (a stub displayio) and LED only keep what is written to
+them.
+
+    scanner = PROFILES["cpb_corona"](adapter=replay, clock=replay.clock)
+    drive("cpb_corona", scanner)
+
+The colours and RSSI thresholds come from contact_scanner.presets. The
+values set at the top of each script (rows, times, table size, colours)
+are in SCRIPT_VALUES, 'python3 tools/profiles.py' check them against the
+scripts (a colour changed in a script must be changed in the presets too,
+or given to that profile), and run the patchwork of show_and_tell_version
+on a crowd to check its grid always have room for the devices. The wiring of the outputs and callbacks is still
+written again here (the scripts need the board to run), keep it in step
+when a script change. not_as_scanner_clue_wip.py does not scan, it has no
+profile.
+
+The scripts run by a Runtime (RUNTIME) are driven the same way by drive(),
+the others by Scanner.scan(), so the ScanSchedule of a script is applied
+like on the board.
+"""
+
+import ast
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+from contact_scanner.engine import Scanner
+from contact_scanner.outputs import (PixelOutput, TrellisOutput, PatchworkOutput,
+                                     LabelOutput, BlinkOutput)
+from contact_scanner import presets
+from contact_scanner.presets import SEC_NS, RSSI_VALUE, small_colors, show_colors
+from contact_scanner.advertising import complete_name
+from contact_scanner.patchwork import PatchworkLayout, SIDES
+from contact_scanner.schedule import ScanSchedule
+from contact_scanner.distinct import DistinctCounter
+from contact_scanner.runtime import Runtime
+
+### The values set at the top of each script
+_LED_VALUES = {"hide_time_ns": 20 * SEC_NS, "stale_time_ns": 200 * SEC_NS, "scan_time_s": 10}
+### The colours of the scripts, as in small_colors() and show_colors()
+_COLORS = {"RSSI_VALUE": presets.RSSI_VALUE, "RSSI_DEFAULT_COLOR": presets.RSSI_DEFAULT_COLOR,
+           "MINI_BLUE": presets.MINI_BLUE}
+_SMALL = dict(_COLORS, RSSI_COLOR=presets.SMALL_RSSI_COLOR, SHADE_BLUE=presets.SMALL_SHADE_BLUE,
+              TIME_BLUE=presets.SMALL_TIME_BLUE)
+_SHOW = dict(_COLORS, RSSI_COLOR=presets.SHOW_RSSI_COLOR, SHADE_BLUE=presets.SHOW_SHADE_BLUE,
+             TIME_BLUE=presets.SHOW_TIME_BLUE)
+SCRIPT_VALUES = {
+    "cpb_corona": dict(_LED_VALUES, rows=10, **_SMALL),
+    "clue_with_snow_pi_rgb": dict(_LED_VALUES, rows=12, **_SMALL),
+    "clue_with_neotrellis": dict(_LED_VALUES, rows=16, **_SMALL),
+    "non_working_PyPortal_version": dict(_LED_VALUES, rows=12, **_SMALL),
+    "show_and_tell_version": dict(_LED_VALUES, rows=16, **_SHOW),
+    "clue_cpb_scanner": {"rows": 10, "stale_time_ns": 65 * SEC_NS, "scan_time_s": 10, "tracked": 40},
+    "itsybitsy_nrf_blink_scanner": dict(_LED_VALUES, rows=10, noblink_time_ns=10 * SEC_NS),
+    "feather_nrf52_blink": dict(_LED_VALUES, rows=10, noblink_time_ns=10 * SEC_NS),
+}
+
+### The scripts run by a Runtime instead of Scanner.run()
+RUNTIME = ("itsybitsy_nrf_blink_scanner", "feather_nrf52_blink")
+
+
+class StubPixels(list):
+    """NeoPixel (or DotStar) keeping the colours in a list."""
+
+    def __init__(self, n):
+        super().__init__([0] * n)
+        self.auto_write = True
+        self.shows = 0
+
+    def show(self):
+        self.shows += 1
+
+
+class FakeI2CDevice:
+    """adafruit_bus_device I2CDevice of a seesaw, counting the transactions and bytes written.
+
+    The NEOPIXEL_BUF writes go to 'buffer', NEOPIXEL_SHOW copy it to 'shown'.
+    """
+
+    def __init__(self, n=16, bpp=3):
+        self.buffer = bytearray(n * bpp)
+        self.shown = bytearray(n * bpp)
+        self.transactions = 0
+        self.bytes = 0
+        self.shows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def write(self, buf, *, start=0, end=None):
+        if end is None:
+            end = len(buf)
+        self.transactions += 1
+        self.bytes += end - start
+        if buf[start] != 0x0E:
+            return
+        if buf[start + 1] == 0x04:
+            offset = (buf[start + 2] << 8) | buf[start + 3]
+            data = buf[start + 4:end]
+            self.buffer[offset:offset + len(data)] = data
+        elif buf[start + 1] == 0x05:
+            self.shown[:] = self.buffer
+            self.shows += 1
+
+
+class StubSeesawPixels:
+    """NeoPixel of adafruit_seesaw: each pixel set is a NEOPIXEL_BUF write (GRB), show() a NEOPIXEL_SHOW."""
+
+    def __init__(self, i2c_device, n):
+        self.i2c_device = i2c_device
+        self.n = n
+        self.auto_write = True
+        self.brightness = 1.0
+
+    def __setitem__(self, index, color):
+        offset = index * 3
+        with self.i2c_device as i2c:
+            i2c.write(bytes((0x0E, 0x04, offset >> 8, offset & 0xFF,
+                             (color >> 8) & 0xFF, (color >> 16) & 0xFF, color & 0xFF)))
+
+    def show(self):
+        with self.i2c_device as i2c:
+            i2c.write(bytes((0x0E, 0x05)))
+
+
+class StubTrellis:
+    """NeoTrellis with only its pixels, on a FakeI2CDevice."""
+
+    def __init__(self, n=16):
+        self.i2c_device = FakeI2CDevice(n)
+        self.pixels = StubSeesawPixels(self.i2c_device, n)
+
+
+class StubLabel:
+    """displayio Label with only text and color."""
+
+    def __init__(self):
+        self.text = ""
+        self.color = 0
+
+
+class StubBitmap:
+    """displayio Bitmap, with only its size and the values set."""
+
+    def __init__(self, width, height, value_count):
+        self.width = width
+        self.height = height
+        self.values = {}
+
+    def __setitem__(self, xy, value):
+        self.values[xy] = value
+
+
+class StubGroup(list):
+    """displayio Group, a list of its layers."""
+
+    def __init__(self, *, scale=1, max_size=None):
+        super().__init__()
+        self.scale = scale
+        self.hidden = False
+
+
+class StubTileGrid:
+    """displayio TileGrid of one bitmap."""
+
+    def __init__(self, bitmap, *, pixel_shader):
+        self.bitmap = bitmap
+        self.pixel_shader = pixel_shader
+
+
+class StubDisplayio:
+    """What PatchworkLayout use of the displayio module."""
+
+    Bitmap = StubBitmap
+    Group = StubGroup
+    TileGrid = StubTileGrid
+
+
+class StubLed:
+    """digitalio.DigitalInOut of a LED."""
+
+    def __init__(self):
+        self.value = False
+
+
+SMALL_COLORS = small_colors()
+SHOW_COLORS = show_colors()
+
+
+def _times(name):
+    values = SCRIPT_VALUES[name]
+    return {"hide_time_ns": values["hide_time_ns"], "stale_time_ns": values["stale_time_ns"],
+            "scan_time_s": values["scan_time_s"]}
+
+
+def cpb_corona(**kwargs):
+    rows = SCRIPT_VALUES["cpb_corona"]["rows"]
+    return Scanner(rows, [PixelOutput(StubPixels(rows), rows, SMALL_COLORS)],
+                   rssi_bands=RSSI_VALUE, schedule=ScanSchedule(max_timeout_s=10),
+                   **_times("cpb_corona"), **kwargs)
+
+
+def clue_with_snow_pi_rgb(**kwargs):
+    rows = SCRIPT_VALUES["clue_with_snow_pi_rgb"]["rows"]
+    return Scanner(rows, [PixelOutput(StubPixels(rows), rows, SMALL_COLORS)],
+                   rssi_bands=RSSI_VALUE, **_times("clue_with_snow_pi_rgb"), **kwargs)
+
+
+def clue_with_neotrellis(bulk=True, **kwargs):
+    rows = SCRIPT_VALUES["clue_with_neotrellis"]["rows"]
+    return Scanner(rows, [TrellisOutput(StubTrellis(), rows, SMALL_COLORS, bulk=bulk)],
+                   rssi_bands=RSSI_VALUE, **_times("clue_with_neotrellis"), **kwargs)
+
+
+def non_working_PyPortal_version(**kwargs):
+    rows = SCRIPT_VALUES["non_working_PyPortal_version"]["rows"]
+    return Scanner(rows, [TrellisOutput(StubTrellis(), rows, SMALL_COLORS)],
+                   rssi_bands=RSSI_VALUE, **_times("non_working_PyPortal_version"), **kwargs)
+
+
+def show_and_tell_version(**kwargs):
+    """The patchwork has the PatchworkLayout of the script, full size at the start."""
+    rows = SCRIPT_VALUES["show_and_tell_version"]["rows"]
+    layout = PatchworkLayout(StubGroup(max_size=len(SIDES)), [0] * 228, displayio=StubDisplayio)
+    layout.fit(rows, 0)
+    outputs = [PixelOutput(StubPixels(rows), rows, SHOW_COLORS),
+               PatchworkOutput(layout.palette, rows, SHOW_COLORS, layout=layout),
+               TrellisOutput(StubTrellis(), rows, SHOW_COLORS)]
+    return Scanner(rows, outputs, rssi_bands=RSSI_VALUE, **_times("show_and_tell_version"), **kwargs)
+
+
+def clue_cpb_scanner(telemetry=None, **kwargs):
+    """The counters and names are kept like the script (without the gc.collect() of each refresh)."""
+    values = SCRIPT_VALUES["clue_cpb_scanner"]
+    rows = values["rows"]
+    stale_time_ns = values["stale_time_ns"]
+    oui_count = {}
+    complete_names_count = {}
+    distinct = DistinctCounter()
+
+    def count_advert(scanner, row, entry, now_ns):
+        addr_key = entry.address.address_bytes
+        oui = addr_key[3:]
+        oui_count[oui] = oui_count.get(oui, 0) + 1
+        c_name = complete_name(entry.advertisement_bytes)
+        if c_name is not None:
+            scanner.devices.names[row] = c_name
+            complete_names_count[c_name] = complete_names_count.get(c_name, 0) + 1
+        if telemetry is not None:
+            telemetry.advert(row, entry, now_ns)
+
+    def summary_text(scanner):
+        seen = distinct.counts(scanner.clock())
+        return ("Seen 1m:{:<4d} 5m:{:<4d} 15m:{:<4d} 1h:{:<4d}\n"
+                "OUIs:{:<4d}  Names:{:<4d}").format(seen[0], seen[1], seen[2], seen[3],
+                                                    len(oui_count), len(complete_names_count))
+
+    labels = LabelOutput([StubLabel() for _ in range(rows)], rows, stale_time_ns,
+                         summary_label=StubLabel(), summary=summary_text)
+    outputs = [labels] if telemetry is None else [labels, telemetry]
+    return Scanner(rows, outputs,
+                   hide_time_ns=stale_time_ns, stale_time_ns=stale_time_ns,
+                   scan_time_s=values["scan_time_s"], tracked=values["tracked"],
+                   names=True, on_advert=count_advert,
+                   distinct=distinct, **kwargs)
+
+
+def _blink_scanner(name, **kwargs):
+    rows = SCRIPT_VALUES[name]["rows"]
+    blink = BlinkOutput(StubLed(), active_ns=SCRIPT_VALUES[name]["noblink_time_ns"])
+    return Scanner(rows, [blink], schedule=ScanSchedule(), **_times(name), **kwargs)
+
+
+def itsybitsy_nrf_blink_scanner(**kwargs):
+    return _blink_scanner("itsybitsy_nrf_blink_scanner", **kwargs)
+
+
+def feather_nrf52_blink(**kwargs):
+    return _blink_scanner("feather_nrf52_blink", **kwargs)
+
+
+PROFILES = {
+    "cpb_corona": cpb_corona,
+    "clue_with_snow_pi_rgb": clue_with_snow_pi_rgb,
+    "clue_with_neotrellis": clue_with_neotrellis,
+    "non_working_PyPortal_version": non_working_PyPortal_version,
+    "show_and_tell_version": show_and_tell_version,
+    "clue_cpb_scanner": clue_cpb_scanner,
+    "itsybitsy_nrf_blink_scanner": itsybitsy_nrf_blink_scanner,
+    "feather_nrf52_blink": feather_nrf52_blink,
+}
+
+
+def drive(name, scanner):
+    """Run the scanner of a profile like its script, until the end of the replay of its adapter.
+
+    Return the Runtime for the scripts in RUNTIME (None for the others).
+    """
+    if name in RUNTIME:
+        runtime = Runtime(scanner, follow_clock=True)
+        runtime.run()
+        return runtime
+    adapter = scanner.adapter
+    while not adapter.done:
+        scanner.scan()
+    return None
+
+
+def script_values(path):
+    """The constant values assigned at the top of a script (the ones that can be computed alone)."""
+    with open(path) as stream:
+        tree = ast.parse(stream.read(), path)
+    values = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            try:
+                values[node.targets[0].id] = eval(compile(ast.Expression(node.value), path, "eval"), {})
+            except Exception:
+                pass
+    return values
+
+
+def check_patchwork(scenario="street", duration_s=600):
+    """Run show_and_tell_version on a crowd, return True if the patchwork always had room.
+
+    Every level shown must hold the squares used, and be built only once.
+    """
+    from crowd import crowd
+    from contact_scanner.capture import ReplayAdapter
+
+    adapter = ReplayAdapter(crowd(scenario, duration_s=duration_s))
+    scanner = show_and_tell_version(adapter=adapter, clock=adapter.clock)
+    layout = scanner.outputs[1].layout
+    fit = layout.fit
+    short = 0
+    levels = set()
+
+    def checked_fit(count, now_ns):
+        nonlocal short
+        changed = fit(count, now_ns)
+        levels.add(layout.level)
+        if layout.capacity(layout.level) < count:
+            short += 1
+        return changed
+    layout.fit = checked_fit
+    drive("show_and_tell_version", scanner)
+    ok = short == 0 and layout.builds == len(levels)
+    print("patchwork on {}: {} levels built, {} changes, {} too small: {}".format(
+        scenario, layout.builds, layout.changes, short, "OK" if ok else "WRONG"))
+    return ok
+
+
+def check():
+    """Compare SCRIPT_VALUES with the scripts and run the patchwork, return True if all is right."""
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    ok = True
+    for name, expected in SCRIPT_VALUES.items():
+        found = script_values(os.path.join(root, name + ".py"))
+        for key, value in expected.items():
+            if found.get(key) != value:
+                print("{}.py: {} is {}, the profile use {}".format(name, key, found.get(key), value))
+                ok = False
+    ok = check_patchwork() and ok
+    print("OK" if ok else "WRONG")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check() else 1)
@@ -0,0 +1,98 @@
+### Replay a capture through the scanners, on a computer
+###
+### python3 tools/replay.py capture.bin [--profile cpb_corona] [--realtime] [--runtime]
+### (the capture is made on a board with capture_recorder.py)
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Run the tracking and rendering of the scripts (see profiles.py) on the
+advertisements of a capture, and report the throughput (advertisements
+per second) and the time taken by each advertisement (latency).
+
+The scanners run like their script (see profiles.drive), with the
+ScanSchedule of the script: the advertisements received while the radio
+would be off are skipped. The clock of the scanner follows the capture,
+so the devices tracked and the colours shown are the same at every run,
+only the times measured depend on the computer.
+
+With --runtime the scanner run as asyncio tasks (contact_scanner.runtime)
+sleeping on the clock of the capture, and the lateness of each task is
+reported instead.
+"""
+
+import argparse
+import time
+
+from profiles import PROFILES, RUNTIME, drive
+
+from contact_scanner.capture import ReplayAdapter
+from contact_scanner.runtime import Runtime
+
+
+def replay(path, profile, *, realtime=False):
+    """Replay the capture in path with one profile, return the time of each advertisement in ns."""
+    with open(path, "rb") as stream:
+        adapter = ReplayAdapter(stream, realtime=realtime)
+        scanner = PROFILES[profile](adapter=adapter, clock=adapter.clock)
+        latencies = []
+        ### Run like the script (with its ScanSchedule), timing each advertisement
+        name = "record" if profile in RUNTIME else "step"
+        function = getattr(scanner, name)
+
+        def timed(*args):
+            start_ns = time.perf_counter_ns()
+            function(*args)
+            latencies.append(time.perf_counter_ns() - start_ns)
+        setattr(scanner, name, timed)
+        drive(profile, scanner)
+    return latencies
+
+
+def replay_runtime(path, profile):
+    """Replay the capture in path with one profile run by the Runtime, print the task statistics."""
+    with open(path, "rb") as stream:
+        adapter = ReplayAdapter(stream)
+        scanner = PROFILES[profile](adapter=adapter, clock=adapter.clock)
+        runtime = Runtime(scanner, follow_clock=True)
+        runtime.run()
+    print("{:28s} {:7d} adverts".format(profile, scanner.adverts))
+    runtime.dump()
+
+
+def report(profile, latencies):
+    """Print one line of results."""
+    if not latencies:
+        print("{:28s} no advertisement".format(profile))
+        return
+    ordered = sorted(latencies)
+    total_ns = sum(latencies)
+    print("{:28s} {:7d} adverts {:9.0f} adverts/s  mean {:6d} ns  p99 {:7d} ns  max {:8d} ns".format(
+        profile,
+        len(latencies),
+        len(latencies) * 1e9 / max(total_ns, 1),
+        total_ns // len(latencies),
+        ordered[len(ordered) * 99 // 100],
+        ordered[-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("capture", help="capture file made by capture_recorder.py")
+    parser.add_argument("--profile", choices=sorted(PROFILES), action="append",
+                        help="script to run (all of them by default)")
+    parser.add_argument("--realtime", action="store_true",
+                        help="give the advertisements at the pace they were received")
+    parser.add_argument("--runtime", action="store_true",
+                        help="run the scanners as asyncio tasks, report the lateness of the tasks")
+    args = parser.parse_args()
+    for profile in args.profile or PROFILES:
+        if args.runtime:
+            replay_runtime(args.capture, profile)
+        else:
+            report(profile, replay(args.capture, profile, realtime=args.realtime))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+### Watch the telemetry of a scanner, on a computer
+###
+### python3 tools/watch_telemetry.py /dev/ttyACM1 [--summary]   (needs pyserial)
+### python3 tools/watch_telemetry.py telemetry.bin              (bytes saved from the port)
+### python3 tools/watch_telemetry.py --check [--scenario transport]
+
+### Copyright (c) 2020 David Glaude
+### MIT License
+
+"""
+Decode the frames sent by contact_scanner.telemetry on the second USB
+serial of a board (usb_cdc.data, the one after the REPL), and print them.
+
+With --check, a synthetic crowd (see crowd.py) is run through the CLUE
+scanner with its telemetry written to a serial port that cut the writes
+when its buffer is full (like a computer not reading), and the frames
+decoded (kind and every field) are compared with the frames sent.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+from contact_scanner.telemetry import Decoder, KIND_ADVERT, KIND_SUMMARY
+
+
+def show(kind, fields, summary_only=False):
+    """Print one frame."""
+    if kind == KIND_ADVERT:
+        if summary_only:
+            return
+        t_ms, address_type, address, rssi, row = fields
+        print("{:10.3f}s  {} {:4d}  row {}".format(
+            t_ms / 1000, ":".join("{:02x}".format(b) for b in reversed(address)), rssi,
+            "-" if row == 255 else row))
+    elif kind == KIND_SUMMARY:
+        t_ms, adverts, dropped, tracked, *seen = fields
+        print("{:10.3f}s  adverts {:5d}  tracked {:3d}  seen {}  dropped {}".format(
+            t_ms / 1000, adverts, tracked, "/".join(str(count) for count in seen), dropped))
+
+
+def watch(source, summary_only=False):
+    """Print the frames of a serial port or of a file, until its end."""
+    decoder = Decoder()
+    if os.path.isfile(source):
+        stream = open(source, "rb")
+    else:
+        import serial
+        stream = serial.Serial(source, timeout=0.1)
+    with stream:
+        while True:
+            data = stream.read(256)
+            if not data and os.path.isfile(source):
+                break
+            for kind, fields in decoder.feed(data):
+                show(kind, fields, summary_only)
+    print("{} frames, {} errors".format(decoder.frames, decoder.errors))
+
+
+class _SlowSerial:
+    """Serial port taking at most room bytes at each write, and reading back every reads writes."""
+
+    def __init__(self, room=100, reads=8):
+        self.room = room
+        self.reads = reads
+        self.out_waiting = 0
+        self.data = bytearray()
+        self._writes = 0
+
+    def write(self, frame):
+        taken = min(len(frame), self.room - self.out_waiting)
+        self.data.extend(frame[:taken])
+        self.out_waiting += taken
+        self._writes += 1
+        if self._writes % self.reads == 0:
+            self.out_waiting = 0
+        return taken
+
+
+def check(scenario, duration_s):
+    """Run a crowd with telemetry on a slow port, return True if the frames decoded are the frames sent."""
+    import struct
+    from crowd import crowd
+    from profiles import PROFILES, drive
+    from contact_scanner.capture import ReplayAdapter
+    from contact_scanner.telemetry import Telemetry, ADVERT, SUMMARY
+
+    class CheckedTelemetry(Telemetry):
+        """Telemetry keeping the fields of every frame sent in full."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.frames = []
+
+        def _send(self, kind, now_ms):
+            fields = struct.unpack_from(ADVERT if kind == KIND_ADVERT else SUMMARY, self._frame, 2)
+            sent = super()._send(kind, now_ms)
+            if sent:
+                self.frames.append((kind, fields[1:]))
+            return sent
+
+    port = _SlowSerial()
+    ### Below the bytes of the crowd, and a port that cut the frames
+    telemetry = CheckedTelemetry(port, bytes_per_s=1200, max_waiting=1000)
+    adapter = ReplayAdapter(crowd(scenario, duration_s=duration_s))
+    scanner = PROFILES["clue_cpb_scanner"](adapter=adapter, clock=adapter.clock, telemetry=telemetry)
+    drive("clue_cpb_scanner", scanner)
+    decoder = Decoder()
+    frames = list(decoder.feed(bytes(port.data)))
+    different = sum(1 for got, sent in zip(frames, telemetry.frames) if got != sent)
+    ok = len(frames) == len(telemetry.frames) and different == 0
+    print("{} adverts, {} frames sent ({} bytes), {} dropped, {} decoded, {} different, "
+          "{} bytes skipped: {}".format(
+              scanner.adverts, telemetry.sent, telemetry.bytes, telemetry.dropped, len(frames),
+              different, decoder.errors, "OK" if ok else "WRONG"))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", nargs="?", help="serial port or file of the telemetry")
+    parser.add_argument("--summary", action="store_true", help="only print the summaries")
+    parser.add_argument("--check", action="store_true", help="check the telemetry on this computer")
+    parser.add_argument("--scenario", default="transport", help="crowd of the check (transport)")
+    parser.add_argument("--duration", type=int, default=120, help="seconds of the check (120)")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(0 if check(args.scenario, args.duration) else 1)
+    if args.source is None:
+        parser.error("a serial port or file is needed (or --check)")
+    watch(args.source, args.summary)
+
+
+if __name__ == "__main__":
+    main()